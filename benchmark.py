@@ -0,0 +1,154 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Benchmarks of the steps of a power iteration (simulation, model construction and compilation,
+gradient evaluations, a short sampling run, the summary) and of the HDI computations, for three
+standard designs. The gradient evaluations are timed with the fused likelihood (the default) and
+with pymc3.Binomial (gradient_binomial). All random numbers come from fixed seeds. The results are written to a JSON file,
+which can serve as the baseline of later runs:
+
+    python benchmark.py --outfile baseline.json
+    python benchmark.py --outfile new.json --baseline baseline.json   # prints new/baseline time ratios
+
+With Numba installed, the sampling run is repeated with the compiled NUTS (backend numba).
+'''
+
+import argparse
+import json
+import platform
+import time
+import warnings
+
+import numpy as np
+import pymc3
+import theano
+from scipy.stats import beta
+
+from tvatojpower.tvatojpower import (simulate_tojs, hierarchical_model_noncentered, HDIofICDF,
+                                     power_hdi, _sample_posterior)
+from tvatojpower import compiled
+
+SEED = 1234
+
+# The standard designs: small, medium, and large; all with both conditions (as in example_power_exp_1.py)
+def design(num_participants, num_SOAs):
+    return {
+        'num_participants': num_participants,
+        'SOAs'            : list(np.linspace(-100.0, 100.0, num_SOAs)),
+        'repetitions'     : [24] * num_SOAs,
+        'C_mu'            : 0.070,
+        'C_sd_between'    : 0.020,
+        'C_sd_within'     : 0.003,
+        'wp_a_mu'         : 0.55,
+        'wp_a_sd_between' : 0.02,
+        'wp_n_mu'         : 0.50,
+        'wp_n_sd_between' : 0.005,
+    }
+
+DESIGNS = {
+    'small' : design(10, 11),
+    'medium': design(35, 11),
+    'large' : design(200, 21),
+}
+
+
+# Runs func repeats times and returns the timing record (in seconds) and the result of the last call
+def timed_calls(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {'median_s': float(np.median(times)), 'min_s': float(np.min(times)), 'repeats': repeats}, result
+
+
+def benchmark_design(setup, repeats, draws, grad_evals):
+    results = {}
+    results['simulate_tojs'], data = timed_calls(lambda: simulate_tojs(setup, rng=SEED), repeats)
+    results['model_construction'], model = timed_calls(lambda: hierarchical_model_noncentered(data), 1)
+
+    # Compilation of the log density and its gradient, and their throughput, with the fused likelihood
+    # (the default) and with pymc3.Binomial
+    models = {'fused': model, 'binomial': hierarchical_model_noncentered(data, likelihood='binomial')}
+    for likelihood, likelihood_model in models.items():
+        suffix = '' if likelihood == 'fused' else '_' + likelihood
+        results['logp_dlogp_compile' + suffix], logp_dlogp = timed_calls(likelihood_model.logp_dlogp_function, 1)
+        logp_dlogp.set_extra_values({})
+        point = likelihood_model.dict_to_array(likelihood_model.test_point)
+        record, _ = timed_calls(lambda: [logp_dlogp(point) for _ in range(grad_evals)], repeats)
+        record['grad_evals_per_s'] = grad_evals / record['median_s']
+        results['gradient' + suffix] = record
+    results['gradient']['speedup_over_binomial'] = (results['gradient_binomial']['median_s'] /
+                                                    results['gradient']['median_s'])
+
+    # A short sampling run of fixed length (tuning and draws), on a single core
+    record, trace = timed_calls(lambda: _sample_posterior(model, 'nuts', draws=draws, tune=draws, chains=2, cores=1,
+                                                          random_seed=[SEED, SEED + 1], progressbar=False), 1)
+    record['draws'] = draws
+    record['tune'] = draws
+    record['chains'] = 2
+    results['sample'] = record
+
+    # The same run with the compiled NUTS (if Numba is installed), after a short run that compiles it
+    if compiled.numba is not None:
+        def sample_numba(draws):
+            return _sample_posterior(model, 'numba', draws=draws, tune=draws, chains=2, cores=1,
+                                     random_seed=[SEED, SEED + 1], progressbar=False)
+        results['numba_compile'], _ = timed_calls(lambda: sample_numba(10), 1)
+        record, _ = timed_calls(lambda: sample_numba(draws), 1)
+        record['draws'] = draws
+        record['tune'] = draws
+        record['chains'] = 2
+        results['sample_numba'] = record
+    with model:
+        results['summary'], _ = timed_calls(lambda: pymc3.summary(trace, hdi_prob=0.95), repeats)
+    return results
+
+
+def benchmark_hdis(repeats):
+    results = {}
+    results['HDIofICDF'], _ = timed_calls(lambda: HDIofICDF(beta, a=81, b=21), repeats)
+    num_success = np.arange(201)
+    attempts = np.full(201, 200)
+    results['power_hdi_201'], _ = timed_calls(lambda: power_hdi(num_success, attempts), repeats)
+    return results
+
+
+def compare(results, baseline):
+    print('%-30s %12s %12s %8s' % ('benchmark', 'baseline_s', 'current_s', 'ratio'))
+    for group, benchmarks in results['results'].items():
+        for name, record in benchmarks.items():
+            old = baseline['results'].get(group, {}).get(name)
+            if old is not None:
+                print('%-30s %12.5f %12.5f %8.2f' % (group + '/' + name, old['median_s'], record['median_s'],
+                                                     record['median_s'] / old['median_s']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the tvatojpower pipeline')
+    parser.add_argument('--outfile', default='benchmark.json', help='JSON file for the results')
+    parser.add_argument('--baseline', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--designs', nargs='+', default=list(DESIGNS), choices=list(DESIGNS))
+    parser.add_argument('--repeats', type=int, default=5, help='Repetitions of the fast benchmarks')
+    parser.add_argument('--draws', type=int, default=200, help='Draws (and tuning steps) of the sampling benchmark')
+    parser.add_argument('--grad-evals', type=int, default=1000, help='Gradient evaluations per repetition')
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    results = {'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                           'processor': platform.processor(), 'numpy': np.__version__,
+                           'pymc3': pymc3.__version__, 'theano': theano.__version__},
+               'seed': SEED,
+               'results': {'hdi': benchmark_hdis(args.repeats)}}
+    for name in args.designs:
+        print('Benchmarking the %s design ...' % name)
+        results['results'][name] = benchmark_design(DESIGNS[name], args.repeats, args.draws, args.grad_evals)
+
+    with open(args.outfile, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to ' + args.outfile)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
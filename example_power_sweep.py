@@ -0,0 +1,51 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.  
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+from tvatojpower import hierarchical_model_noncentered, sweep
+
+'''
+This example estimates a power curve for the design of example_power_single_C.py:
+How many participants do we need to reach 80 % power, and how does this depend on
+the size of the attention effect on the probe's attentional weight?
+'''
+
+# Step 1: Define the base design. The values varied in the sweep are taken from the grid below.
+design = {
+    'num_participants'   : 25,                         # Number of participants (varied below)
+    'SOAs'               : [-100.0, -80.0, -60.0,      # SOAs
+                            -40.0, -20.0, 0.0, 20.0,
+                            40.0, 60.0, 80.0, 100.0],
+
+    'repetitions'        : [24, 24, 32, 32, 48,        # Repetitions of each SOAs
+                            48, 48, 32, 32, 24, 24],
+    'C_single_mu'        : 0.070,                      # Group mean of simulted Cs
+    'C_single_sd_between': 0.020,                      # Group SD of the Cs
+    'wp_a_mu'            : 0.55,                       # Group mean of simultated wp for the attention condition (varied below)
+    'wp_a_sd_between'    : 0.02,                       # SD of wp_attended
+    'wp_n_mu'            : 0.50,                       # Group mean of wp_neutral ...
+    'wp_n_sd_between'    : 0.005,                      # SD of wp_neutral ...
+}
+
+grid = {
+    'num_participants'   : [10, 20, 30, 40, 50, 60],
+    'wp_a_mu'            : [0.53, 0.55, 0.60],
+}
+
+# Step 2: Define your research goals. (When was the experiment succesful?)
+def check_weights(summary_stats):
+    return summary_stats['hdi_2.5%']['wp_diff_mean'] > 0    # The probe's weight is larger in the attention condition
+
+# Step 3: Run all cells of the grid in one scheduled job
+power_curve = sweep(base_design=design,
+                    grid=grid,
+                    model_func=hierarchical_model_noncentered,
+                    condition_func=check_weights,
+                    single_C=True,
+                    goal_var_names=['wp_diff_mean'],
+                    target_power=0.8,                       # Cells stop once their power HDI excludes 0.8 ...
+                    max_iterations=200,                     # ... or after 200 iterations at the latest
+                    outfile='sweep.csv')
+
+print(power_curve)
+power_curve.to_csv('power_curve.csv')
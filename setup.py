@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='tvatojpower',
       version='0.9',
@@ -9,4 +9,5 @@ setup(name='tvatojpower',
       author_email='jan.tuennermann@uni-marburg.de',
       url='https://github.com/jeti182/tvatoj-power',
       packages=['tvatojpower'],
+      entry_points={'console_scripts': ['tvatojpower = tvatojpower.cli:main']},
      )
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pymc3')
+
+from tvatojpower import tvatojpower
+
+DESIGN = {'num_participants': 3, 'SOAs': [-60., 0., 60.], 'repetitions': [20] * 3,
+          'C_mu': 0.07, 'C_sd_between': 0.01, 'C_sd_within': 0.003,
+          'wp_a_mu': 0.6, 'wp_a_sd_between': 0.05, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.05}
+
+
+# A deterministic stand-in for simulating and fitting an iteration, from its random stream only.
+# After interrupt_after calls, it raises KeyboardInterrupt, as if the run was killed.
+class FakeFit:
+    def __init__(self, interrupt_after=None):
+        self.calls = 0
+        self.interrupt_after = interrupt_after
+
+    def __call__(self, model, setup, seed_seq, condition_func, goal_var_names, log_var_names, **kwargs):
+        if self.calls == self.interrupt_after:
+            raise KeyboardInterrupt
+        self.calls += 1
+        rng = np.random.default_rng(seed_seq)
+        summary = pd.DataFrame({'mean': rng.random(2), 'sd': rng.random(2) / 10}, index=['C_mu[0]', 'C_mu[1]'])
+        return int(rng.random() < 0.6), summary, summary.copy(), {}
+
+
+def run(monkeypatch, outfile, fake_fit, **kwargs):
+    monkeypatch.setattr(tvatojpower, '_fit_iteration', fake_fit)
+    monkeypatch.setattr(tvatojpower, 'get_model', lambda *args, **kwargs: None)
+    return tvatojpower.sim_and_fit(DESIGN, None, iterations=10, condition_func=None, outfile=outfile,
+                                   backend='mle', metrics_outfile=None, **kwargs)
+
+
+# A run killed after some iterations and resumed (without its seed, which the checkpoint recorded)
+# writes what an uninterrupted run writes, and the resumed part only fits the remaining iterations
+def test_resumed_run_equals_straight_run(tmp_path, monkeypatch):
+    straight = run(monkeypatch, str(tmp_path / 'straight.csv'), FakeFit(), seed=1234)
+    with pytest.raises(KeyboardInterrupt):
+        run(monkeypatch, str(tmp_path / 'resumed.csv'), FakeFit(interrupt_after=4), seed=1234)
+    assert len(pd.read_csv(tmp_path / 'resumed.csv', index_col=0)['iteration'].unique()) == 4
+    fake_fit = FakeFit()
+    resumed = run(monkeypatch, str(tmp_path / 'resumed.csv'), fake_fit, seed=None, resume=True)
+    assert fake_fit.calls == 6
+    assert resumed[0] == straight[0] and resumed[2] == straight[2]
+    assert np.array_equal(resumed[1], straight[1])
+    assert (tmp_path / 'resumed.csv').read_bytes() == (tmp_path / 'straight.csv').read_bytes()
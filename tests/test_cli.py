@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shard_frame(iterations, successes):
+    rows = [pd.DataFrame({'iteration': i, 'success': s, 'power_est': 0.0, 'power_hdi_2.5%': 0.0,
+                          'power_hdi_97.5%': 1.0, 'mean': [0.1 * i, 0.2 * i], 'sd': [0.01, 0.02]},
+                         index=['C_mu[0]', 'C_mu[1]']) for i, s in zip(iterations, successes)]
+    return pd.concat(rows)
+
+
+# Merging shards needs neither PyMC3 nor Theano, e.g., on a machine that only collects results
+def test_merge_without_pymc3(tmp_path):
+    shard_frame([1, 2], [1, 0]).to_csv(tmp_path / 'run.shard1-2.csv')
+    shard_frame([3, 4], [1, 1]).to_csv(tmp_path / 'run.shard2-2.csv')
+    script = textwrap.dedent('''
+        import sys
+        from tvatojpower.cli import main
+        main(['merge', 'run.shard1-2.csv', 'run.shard2-2.csv', '--outfile', 'run.csv'])
+        assert 'theano' not in sys.modules and 'pymc3' not in sys.modules
+    ''')
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=tmp_path, env=env)
+    assert result.returncode == 0, result.stderr
+    merged = pd.read_csv(tmp_path / 'run.csv', index_col=0)
+    assert list(merged['iteration'].unique()) == [1, 2, 3, 4]
+    assert merged.groupby('iteration')['power_est'].first().tolist() == [1.0, 0.5, 2 / 3, 0.75]
+
+
+DESIGN = {'num_participants': 3, 'SOAs': [-60., 0., 60.], 'repetitions': [20] * 3,
+          'C_mu': 0.07, 'C_sd_between': 0.01, 'C_sd_within': 0.003,
+          'wp_a_mu': 0.6, 'wp_a_sd_between': 0.05, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.05}
+
+
+# A deterministic stand-in for simulating and fitting an iteration, from its random stream only
+def fake_fit_iteration(model, setup, seed_seq, condition_func, goal_var_names, log_var_names, **kwargs):
+    import numpy as np
+    rng = np.random.default_rng(seed_seq)
+    summary = pd.DataFrame({'mean': rng.random(2), 'sd': rng.random(2) / 10}, index=['C_mu[0]', 'C_mu[1]'])
+    return int(rng.random() < 0.6), summary, summary.copy(), {}
+
+
+# The merged shards of a seeded run are the output of the run itself, to the byte
+def test_merged_shards_equal_run(tmp_path, monkeypatch):
+    import pytest
+    pytest.importorskip('pymc3')
+    from tvatojpower import tvatojpower
+    from tvatojpower.cli import main
+    monkeypatch.setattr(tvatojpower, '_fit_iteration', fake_fit_iteration)
+    monkeypatch.setattr(tvatojpower, 'get_model', lambda *args, **kwargs: None)
+    kwargs = dict(iterations=10, condition_func=None, seed=1234, backend='mle', checkpoint=None, metrics_outfile=None)
+    tvatojpower.sim_and_fit(DESIGN, None, outfile=str(tmp_path / 'run.csv'), **kwargs)
+    shards = [str(tmp_path / ('run.shard%d-3.csv' % (i + 1))) for i in range(3)]
+    for i, shard in enumerate(shards):
+        tvatojpower.sim_and_fit(DESIGN, None, outfile=shard, shard=(i, 3), **kwargs)
+    main(['merge'] + shards[::-1] + ['--outfile', str(tmp_path / 'merged.csv')])
+    assert (tmp_path / 'merged.csv').read_bytes() == (tmp_path / 'run.csv').read_bytes()
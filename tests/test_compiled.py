@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+numba = pytest.importorskip('numba')
+
+
+# Runs the serial variant first, then the parallel one, in a fresh process with an empty cache. The
+# parallel variant must not pick up the cached serial code, and must be compiled with parfors.
+SCRIPT = textwrap.dedent('''
+    import numpy as np
+    from tvatojpower import compiled
+
+    arrays = {'participant_id': np.array([0, 0, 1, 1]), 'condition_id': np.array([0, 1, 0, 1]),
+              'SOA': np.array([-50., 50., -50., 50.]), 'repetitions': np.array([10, 10, 10, 10]),
+              'probe_first_count': np.array([7, 2, 6, 3]), 'participant_mask': np.ones(2)}
+    serial = compiled.compiled_nuts(arrays, 2, 2, draws=20, tune=20, chains=2, cores=1, seeds=[1, 2])
+    parallel = compiled.compiled_nuts(arrays, 2, 2, draws=20, tune=20, chains=2, cores=2, seeds=[1, 2])
+    assert not compiled._chains_parallel.stats.cache_hits, 'parallel variant loaded from the cache'
+    compiled._chains_parallel.parallel_diagnostics(level=1)
+    for name in serial[0]:
+        assert np.array_equal(serial[0][name], parallel[0][name]), name
+''')
+
+
+def test_parallel_chains_after_serial(tmp_path):
+    env = dict(os.environ, NUMBA_CACHE_DIR=str(tmp_path))
+    result = subprocess.run([sys.executable, '-c', SCRIPT], capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode == 0, result.stderr
+
+
+# The log density of hierarchical_model_noncentered with SciPy's densities (including the constants
+# the compiled version leaves out), on the parameter vector of the compiled sampler
+def reference_logp(x, p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants):
+    from scipy.stats import norm, halfcauchy, binom
+    from tvatojpower.simulation import tvatoj_psychometric_function
+    C_mu, log_C_sd, wp_mu, log_wp_sd, wp_e, C_e = np.split(x, np.cumsum([num_C, num_C, num_wp, num_wp,
+                                                                          num_participants * num_wp]))
+    C = np.clip(C_mu + C_e.reshape(num_participants, num_C) * np.exp(log_C_sd), 0.0001, 0.9999)
+    wp = np.clip(wp_mu + wp_e.reshape(num_participants, num_wp) * np.exp(log_wp_sd), 0.0001, 0.9999)
+    theta = tvatoj_psychometric_function(SOA, C[p_id, C_col], wp[p_id, wp_col])
+    return (norm.logpdf(C_mu, 0.080, 0.050).sum() + norm.logpdf(wp_mu, 0.5, 0.2).sum() +
+            (halfcauchy.logpdf(np.exp(log_C_sd), scale=0.1) + log_C_sd).sum() +
+            (halfcauchy.logpdf(np.exp(log_wp_sd), scale=0.2) + log_wp_sd).sum() +
+            norm.logpdf(wp_e).sum() + norm.logpdf(C_e).sum() + binom.logpmf(k, n, theta).sum())
+
+
+# The compiled log density agrees with the reference (up to its constant), and its gradient with
+# finite differences, at random points of the posterior's typical range
+@pytest.mark.parametrize('num_C, num_wp', [(2, 2), (1, 2), (1, 1)])
+def test_logp_and_grad_match_reference(num_C, num_wp):
+    from tvatojpower import compiled
+    rng = np.random.default_rng(0)
+    num_participants, SOAs = 4, np.array([-100., -50., -20., 0., 20., 50., 100.])
+    p_id = np.repeat(np.arange(num_participants), 2 * len(SOAs))
+    condition = np.tile(np.repeat([0, 1], len(SOAs)), num_participants)
+    SOA = np.tile(SOAs, 2 * num_participants)
+    n = np.full(len(SOA), 24.)
+    k = rng.integers(0, 25, len(SOA)).astype(float)
+    data = (p_id, np.minimum(condition, num_C - 1), np.minimum(condition, num_wp - 1), SOA, n, k,
+            num_C, num_wp, num_participants)
+    work = np.zeros((6, num_participants, 2))
+
+    def logp_and_grad(x):
+        grad = np.zeros_like(x)
+        return compiled._logp_and_grad(x, grad, work, *data), grad
+
+    offsets = []
+    for _ in range(5):
+        x = np.concatenate([rng.normal(0.07, 0.01, num_C), np.log(rng.uniform(0.005, 0.02, num_C)),
+                            rng.uniform(0.4, 0.6, num_wp), np.log(rng.uniform(0.02, 0.1, num_wp)),
+                            rng.normal(0, 1, num_participants * (num_wp + num_C))])
+        logp, grad = logp_and_grad(x)
+        reference = reference_logp(x, *data)
+        offsets.append(reference - logp)
+        e = 1e-6
+        fd = np.array([(logp_and_grad(x + e * unit)[0] - logp_and_grad(x - e * unit)[0]) / (2 * e)
+                       for unit in np.eye(len(x))])
+        assert np.max(np.abs(grad - fd)) < 1e-6 * np.max(np.abs(grad))
+    assert np.ptp(offsets) < 1e-12 * np.max(np.abs(offsets))
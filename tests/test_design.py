@@ -0,0 +1,21 @@
+import numpy as np
+
+from tvatojpower.design import optimal_design, relative_efficiency
+
+
+DESIGN = {'num_participants': 20, 'SOAs': [-100., -60., -20., 0., 20., 60., 100.], 'repetitions': [24] * 7,
+          'C_mu': 0.07, 'C_sd_between': 0.02, 'C_sd_within': 0.003,
+          'wp_a_mu': 0.6, 'wp_a_sd_between': 0.05, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.05}
+
+
+# The optimized allocation keeps the number of trials and is at least as efficient as the given
+# design, and efficiencies scale with the number of trials
+def test_optimal_design_is_more_efficient():
+    optimized = optimal_design(DESIGN, criterion='D', min_repetitions=4, draws=300, rng=0)
+    assert sum(optimized['repetitions']) == sum(DESIGN['repetitions'])
+    assert min(optimized['repetitions']) >= 4 and set(optimized['SOAs']) <= set(np.arange(-100., 101., 10.))
+    assert relative_efficiency(optimized, DESIGN, draws=300, rng=0) > 1
+    assert np.isclose(relative_efficiency(DESIGN, DESIGN, draws=300, rng=0), 1)
+    doubled = dict(DESIGN, repetitions=[48] * 7)
+    for criterion in ('D', 'wp', 'C'):
+        assert np.isclose(relative_efficiency(doubled, DESIGN, criterion=criterion, draws=300, rng=0), 2)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('theano')
+
+from tvatojpower.likelihood import toj_binomial_logp_grad, toj_binomial_logp_hessian
+
+
+def rows(size=40):
+    rng = np.random.default_rng(0)
+    SOA = rng.choice([-100., -50., -10., 0., 10., 50., 100.], size)
+    n = np.full(size, 20.)
+    k = rng.integers(0, 21, size).astype(float)
+    return rng.uniform(0.01, 0.08, size), rng.uniform(0.01, 0.08, size), SOA, n, k
+
+
+# The second derivatives agree with finite differences of the gradient
+def test_hessian_matches_gradient():
+    vp, vr, SOA, n, k = rows()
+    h_pp, h_pr, h_rr = toj_binomial_logp_hessian(vp, vr, SOA, n, k)
+    e = 1e-7
+    d_vp = [(a - b) / (2 * e) for a, b in zip(toj_binomial_logp_grad(vp + e, vr, SOA, n, k),
+                                              toj_binomial_logp_grad(vp - e, vr, SOA, n, k))]
+    d_vr = [(a - b) / (2 * e) for a, b in zip(toj_binomial_logp_grad(vp, vr + e, SOA, n, k),
+                                              toj_binomial_logp_grad(vp, vr - e, SOA, n, k))]
+    for h, fd in [(h_pp, d_vp[0]), (h_pr, d_vp[1]), (h_pr, d_vr[0]), (h_rr, d_vr[1])]:
+        assert np.allclose(h, fd, rtol=1e-5, atol=1e-3)
+
+
+# The Laplace approximation needs the Hessian of the model, including the fused likelihood
+def test_laplace_on_default_model():
+    pytest.importorskip('pymc3')
+    from tvatojpower.tvatojpower import hierarchical_model_noncentered, simulate_tojs, _sample_posterior
+
+    setup = {'num_participants': 4, 'SOAs': [-60., -20., 0., 20., 60.], 'repetitions': [20] * 5,
+             'C_mu': 0.07, 'C_sd_between': 0.01, 'C_sd_within': 0.003,
+             'wp_a_mu': 0.6, 'wp_a_sd_between': 0.05, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.05}
+    model = hierarchical_model_noncentered(simulate_tojs(setup, rng=0))
+    trace = _sample_posterior(model, backend='laplace', draws=50, random_seed=[0], progressbar=False)
+    assert trace.posterior['C_mu'].shape[:2] == (1, 50)
+    assert np.all(np.isfinite(trace.posterior['wp_mu'].values))
+
+
+# The log-likelihood and its gradient come from one evaluation of the rows
+def test_gradient_from_the_same_evaluation(monkeypatch):
+    import theano
+    import theano.tensor as tt
+    from tvatojpower import likelihood
+    vp, vr, SOA, n, k = rows()
+    calls = []
+    rows_of = likelihood._rows
+    monkeypatch.setattr(likelihood, '_rows', lambda *args: calls.append(1) or rows_of(*args))
+    monkeypatch.setattr(theano.config, 'compute_test_value', 'off') # pymc3 turns test values on
+    vp_var, vr_var = tt.dvector(), tt.dvector()
+    logp = likelihood.toj_binomial_logp_tensor(vp_var, vr_var, SOA, n, k.astype('int64'))
+    logp_and_grad = theano.function([vp_var, vr_var], [logp] + tt.grad(logp, [vp_var, vr_var]))
+    value, d_vp, d_vr = logp_and_grad(vp, vr)
+    assert len(calls) == 1
+    assert np.isclose(value, likelihood.toj_binomial_logp(vp, vr, SOA, n, k))
+    expected = toj_binomial_logp_grad(vp, vr, SOA, n, k)
+    assert np.allclose(d_vp, expected[0]) and np.allclose(d_vr, expected[1])
+
+
+# Misspelled likelihoods are errors, not silently the binomial one
+def test_unknown_likelihood():
+    pytest.importorskip('pymc3')
+    from tvatojpower.tvatojpower import hierarchical_model_noncentered, simulate_tojs
+    setup = {'num_participants': 2, 'SOAs': [-20., 20.], 'repetitions': [10] * 2,
+             'C_mu': 0.07, 'C_sd_between': 0.01, 'C_sd_within': 0.003,
+             'wp_a_mu': 0.6, 'wp_a_sd_between': 0.05, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.05}
+    with pytest.raises(ValueError):
+        hierarchical_model_noncentered(simulate_tojs(setup, rng=0), likelihood='poisson')
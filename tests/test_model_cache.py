@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('pymc3')
+
+from tvatojpower.tvatojpower import (hierarchical_model_noncentered, get_model, simulate_tojs,
+                                     _actual_lengths, _drop_padded, _sample_posterior)
+
+
+def design(num_participants):
+    return {'num_participants': num_participants, 'SOAs': [-60., -20., 0., 20., 60.], 'repetitions': [20] * 5,
+            'C_mu': 0.07, 'C_sd_between': 0.01, 'C_sd_within': 0.003,
+            'wp_a_mu': 0.6, 'wp_a_sd_between': 0.05, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.05}
+
+
+# Without maximum shapes, designs of different sizes get models of their own layout
+def test_models_follow_the_layout():
+    small = get_model(hierarchical_model_noncentered, simulate_tojs(design(3), rng=0))
+    large = get_model(hierarchical_model_noncentered, simulate_tojs(design(5), rng=0))
+    assert small is not large
+    assert large['participant_mask'].get_value().shape == (5,)
+    assert small['participant_mask'].get_value().shape == (3,)
+
+
+# A model shared via maximum shapes pads smaller designs, whose padded participants are not summarized
+def test_padded_participants_are_not_summarized():
+    data = simulate_tojs(design(3), rng=0)
+    model = get_model(hierarchical_model_noncentered, data, max_participants=5, max_rows=50)
+    index = (['C_mu[0]', 'C_mu[1]'] + ['C[%d, %d]' % (p, c) for p in range(5) for c in range(2)] +
+             ['wp_diff_mean'] + ['theta[%d]' % r for r in range(50)])
+    summary = _drop_padded(pd.DataFrame({'mean': range(len(index))}, index=index), _actual_lengths(model, data))
+    assert list(summary.index[2:8]) == ['C[%d, %d]' % (p, c) for p in range(3) for c in range(2)]
+    assert len(summary) == 2 + 3 * 2 + 1 + len(data)
+
+
+# Cached models sample again with their reused NUTS step
+def test_reused_step_samples():
+    model = get_model(hierarchical_model_noncentered, simulate_tojs(design(3), rng=0))
+    for seed in (0, 1):
+        trace = _sample_posterior(model, 'nuts', draws=5, tune=5, chains=1, cores=1, random_seed=[seed],
+                                  progressbar=False)
+        assert len(trace) == 5
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from scipy.stats import beta
+
+from tvatojpower.power import HDIofICDF, power_hdi
+
+COUNTS = [(0, 10), (1, 10), (3, 10), (10, 10), (5, 37), (81, 100), (500, 1000), (999, 1000)]
+
+
+# The vectorized search finds the intervals of the original scalar optimization
+@pytest.mark.parametrize('num_success, attempts', COUNTS)
+def test_power_hdi_matches_hdi_of_icdf(num_success, attempts):
+    expected = HDIofICDF(beta, a=1 + num_success, b=1 + attempts - num_success)
+    assert np.allclose(power_hdi(num_success, attempts), expected, rtol=0, atol=5e-6)
+
+
+# Arrays of counts give the intervals of the single counts
+def test_power_hdi_arrays():
+    num_success, attempts = np.array(COUNTS).T
+    intervals = power_hdi(num_success, attempts)
+    assert intervals.shape == (len(COUNTS), 2)
+    assert np.allclose(intervals, [power_hdi(s, n) for s, n in COUNTS], rtol=0, atol=1e-12)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tvatojpower.results import ResultsStore, open_results, read_results, export_csv
+
+
+# The summaries of iterations as sim_and_fit logs them (one row per variable)
+def run_frames(iterations, rng=0):
+    rng = np.random.default_rng(rng)
+    frames = []
+    for i in range(1, iterations + 1):
+        frames.append(pd.DataFrame({'iteration': i, 'success': i % 2, 'power_est': 0.5, 'power_hdi_2.5%': 0.1,
+                                    'power_hdi_97.5%': 0.9, 'mean': rng.random(3), 'sd': rng.random(3)},
+                                   index=['C_mu[0]', 'C_mu[1]', 'wp_diff_mean']))
+    return frames
+
+
+# Appending in chunks and reading back gives the appended frames, with the schema's types
+@pytest.mark.parametrize('file_format', ['parquet', 'npz'])
+def test_store_round_trip(tmp_path, file_format):
+    if file_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    frames = run_frames(7)
+    store = ResultsStore(str(tmp_path / 'run'), chunk_size=3, file_format=file_format)
+    for frame in frames:
+        store.append(frame)
+    store.close()
+    expected = pd.concat(frames)
+    out_df = read_results(str(tmp_path / 'run'))
+    assert list(out_df.columns) == list(expected.columns)
+    assert out_df.index.name is None
+    pd.testing.assert_frame_equal(out_df, expected, check_dtype=False)
+    assert out_df['iteration'].dtype == 'int32' and out_df['mean'].dtype == 'float64'
+    subset = read_results(str(tmp_path / 'run'), iterations=[2, 6], variables=['C_mu'])
+    pd.testing.assert_frame_equal(subset, expected[expected['iteration'].isin([2, 6]) &
+                                                   expected.index.str.startswith('C_mu')], check_dtype=False)
+
+
+# A results directory exported as CSV is the CSV file the run would have written
+@pytest.mark.parametrize('file_format', ['parquet', 'npz'])
+def test_export_csv_matches_csv_output(tmp_path, file_format):
+    if file_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    for path, kwargs in ((str(tmp_path / 'run.csv'), {}), (str(tmp_path / 'run'), {'file_format': file_format})):
+        output = open_results(path, **kwargs)
+        for frame in run_frames(4):
+            output.append(frame)
+        output.close()
+    export_csv(str(tmp_path / 'run'), str(tmp_path / 'exported.csv'))
+    assert (tmp_path / 'exported.csv').read_bytes() == (tmp_path / 'run.csv').read_bytes()
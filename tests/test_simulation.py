@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from tvatojpower.simulation import (simulate_subject_toj, simulate_toj_counts, participant_parameters,
+                                    tvatoj_psychometric_function)
+
+
+SOAs = [-100, -50, -20, 0, 20, 50, 100]
+
+
+# The generative and the binomial simulation agree, including at the boundaries of wp (where
+# one stimulus never arrives, and the judgments are deterministic)
+@pytest.mark.parametrize('wp', [0.0, 1e-4, 0.3, 0.5, 0.7, 1 - 1e-4, 1.0])
+def test_simulations_agree(wp):
+    reps, C = 4000, 0.08
+    with np.errstate(divide='ignore'):
+        generative = np.array([simulate_subject_toj(SOA, reps, C, wp, rng=i) for i, SOA in enumerate(SOAs)])
+    binomial = simulate_toj_counts(np.array(SOAs, dtype=float), reps, C, wp, rng=0)
+    p = tvatoj_psychometric_function(np.array(SOAs, dtype=float), C, wp)
+    sd = np.sqrt(reps * p * (1 - p))
+    assert np.all(np.abs(generative - reps * p) <= 5 * sd)
+    assert np.all(np.abs(binomial - reps * p) <= 5 * sd)
+    if wp in (0.0, 1.0):
+        assert np.array_equal(generative, binomial)
+
+
+# Drawn wps beyond [0, 1] are clipped, so both simulations see the same participants
+def test_drawn_wp_is_clipped():
+    setup = {'num_participants': 200, 'C_mu': 0.08, 'C_sd_between': 0.02, 'wp_mu': 1.05, 'wp_sd_between': 0.1}
+    C, wp = participant_parameters(setup, rng=1)
+    assert wp.min() >= 0 and wp.max() <= 1 and np.any(wp == 1)
+    setup = {'num_participants': 200, 'C_mu': 0.08, 'C_sd_between': 0.02, 'C_sd_within': 0.01,
+             'wp_a_mu': -0.05, 'wp_a_sd_between': 0.1, 'wp_n_mu': 0.5, 'wp_n_sd_between': 0.1}
+    C, wp = participant_parameters(setup, rng=1)
+    assert wp.min() == 0 and wp.max() <= 1
+    with np.errstate(divide='ignore'):
+        generative = simulate_subject_toj(50, 100, 0.08, 1.0, rng=0)
+    assert generative == simulate_toj_counts(50., 100, 0.08, 1.0, rng=0) == 100
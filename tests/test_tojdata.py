@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from tvatojpower.tojdata import toj_counts
+
+
+# Trial-level data (shuffled, with arbitrary participant labels) collapse into one cell per
+# participant, condition, and SOA, with the counts of a groupby over the trials
+def test_trials_collapse_into_counts():
+    rng = np.random.default_rng(0)
+    trials = pd.DataFrame({'participant_id': rng.choice(['s07', 's12', 's03'], 3000),
+                           'condition_id': rng.integers(0, 2, 3000),
+                           'SOA': rng.choice([-60., -20., 0., 20., 60.], 3000),
+                           'probe_first': rng.random(3000) < 0.4})
+    counts = toj_counts(trials)
+    expected = trials.groupby(['participant_id', 'condition_id', 'SOA'])['probe_first'].agg(['size', 'sum'])
+    assert len(counts) == len(expected) == 3 * 2 * 5
+    assert list(counts.participant_labels) == ['s03', 's07', 's12']
+    frame = counts.to_frame()
+    frame['participant_id'] = counts.participant_labels[frame['participant_id']]
+    frame = frame.set_index(['participant_id', 'condition_id', 'SOA'])
+    assert np.array_equal(frame['repetitions'], expected['size'])
+    assert np.array_equal(frame['probe_first_count'], expected['sum'])
+    # Counts of the same cells (e.g., from two sessions) add up
+    sessions = toj_counts(pd.concat([frame.reset_index(), frame.reset_index()]))
+    assert np.array_equal(sessions['repetitions'], 2 * frame['repetitions'])
+    assert np.array_equal(sessions['probe_first_count'], 2 * frame['probe_first_count'])
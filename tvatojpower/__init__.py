@@ -1,8 +1,42 @@
 # Copyright (c) 2020 Jan Tünnermann. All rights reserved.
-# This work is licensed under the terms of the MIT license.  
+# This work is licensed under the terms of the MIT license.
 # For a copy, see <https://opensource.org/licenses/MIT>.
 
-from .tvatojpower import (
-   hierarchical_model_noncentered,
-   sim_and_fit
+from importlib import import_module
+
+from .simulation import (
+   tvatoj_psychometric_function,
+   simulate_subject_toj,
+   simulate_toj_counts,
+   simulate_tojs
 )
+from .tojdata import TOJCounts, toj_counts
+from .pilot import posterior_setups
+from .design import optimal_design, relative_efficiency
+
+# Everything else needs PyMC3 and Theano (or pandas and SciPy) and is imported on first use,
+# so that simulations and the psychometric function start up quickly.
+_lazy = {
+   'hierarchical_model_noncentered': 'tvatojpower',
+   'sim_and_fit': 'tvatojpower',
+   'power_hdi': 'power',
+   'get_model': 'tvatojpower',
+   'reproduce_iteration': 'tvatojpower',
+   'design_grid': 'sweep',
+   'sweep': 'sweep',
+   'PowerSurrogate': 'surrogate',
+   'read_results': 'results',
+   'export_csv': 'results',
+}
+
+def __getattr__(name):
+   if name not in _lazy:
+      raise AttributeError('module %r has no attribute %r' % (__name__, name))
+   module = import_module('.' + _lazy[name], __name__)
+   for lazy_name, module_name in _lazy.items(): # Also replaces the submodule sweep, which importing it binds here
+      if module_name == _lazy[name]:
+         globals()[lazy_name] = getattr(module, lazy_name)
+   return globals()[name]
+
+def __dir__():
+   return sorted(list(globals()) + list(_lazy))
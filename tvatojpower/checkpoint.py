@@ -0,0 +1,58 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Durable checkpoints of power runs. Every finished iteration (its success and its logged summary)
+is committed to an SQLite database, together with the master seed of the run. As the random
+streams of all iterations are derived from the master seed and the iteration index, this is all
+that is needed to continue a killed run exactly where it stopped.
+'''
+
+from io import StringIO
+import sqlite3
+
+import pandas as pd
+
+
+class Checkpoint:
+    '''Record of a (possibly interrupted) power run in an SQLite database.
+
+    :param path: The database file
+    :param resume: Whether to keep the iterations recorded earlier (otherwise, they are discarded)
+    '''
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            if not resume:
+                self.connection.execute('DROP TABLE IF EXISTS run')
+                self.connection.execute('DROP TABLE IF EXISTS iterations')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS iterations '
+                                    '(iteration INTEGER PRIMARY KEY, success INTEGER, summary TEXT)')
+
+    def entropy(self, entropy):
+        '''Returns the master seed of the recorded run, or records entropy as such if there is none.'''
+        row = self.connection.execute("SELECT value FROM run WHERE key = 'entropy'").fetchone()
+        if row is not None:
+            return int(row[0])
+        with self.connection:
+            self.connection.execute("INSERT INTO run VALUES ('entropy', ?)", (str(entropy),))
+        return entropy
+
+    def iterations(self):
+        '''Returns the recorded iterations as a list of (iteration, success, summary) tuples.'''
+        rows = self.connection.execute('SELECT iteration, success, summary FROM iterations ORDER BY iteration')
+        return [(iteration, success, pd.read_csv(StringIO(summary), index_col=0, float_precision='round_trip'))
+                for iteration, success, summary in rows]
+
+    def record(self, iteration, success, summary):
+        '''Commits a finished iteration.'''
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO iterations VALUES (?, ?, ?)',
+                                    (iteration, int(success), summary.to_csv()))
+
+    def close(self):
+        self.connection.close()
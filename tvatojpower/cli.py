@@ -0,0 +1,168 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Command-line runner of power analyses (installed as the tvatojpower command). A run file (YAML or
+JSON) holds the design, the goal as an expression, and the settings of sim_and_fit:
+
+    design:
+      num_participants: 25
+      SOAs: [-100, -60, -20, 0, 20, 60, 100]
+      ...
+    goal: "hdi_low['va_diff_mean'] > 0.004 and (hdi_low['vp_diff_mean'] > 0 or hdi_high['vr_diff_mean'] < 0)"
+    settings:
+      iterations: 1000
+      seed: 1234
+      single_C: true
+      goal_var_names: [va_diff_mean, vp_diff_mean, vr_diff_mean]
+
+    tvatojpower run power.yaml                  # all iterations
+    tvatojpower run power.yaml --shard 3/100    # the 3rd of 100 parts, e.g., as a batch-array task
+    tvatojpower merge power.shard*-100.csv --outfile power.csv
+
+The shards of a seeded run perform disjoint parts of its iterations with the random streams these
+iterations would have in a single run, so the merged output is that of the single run.
+'''
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+class GoalExpression:
+    '''A condition_func given as a Python expression, evaluated on the summary of an iteration.
+    The expression can use summary (the summary frame, as passed to condition_func), its columns
+    mean, sd, hdi_low, and hdi_high (indexed by variable, e.g., hdi_low['wp_diff_mean']), and abs, min,
+    and max. Unlike a lambda, it can be sent to worker processes.'''
+
+    def __init__(self, expression):
+        self.expression = expression
+        compile(expression, '<goal>', 'eval') # Syntax errors show up before any iteration runs
+
+    COLUMNS = {'mean': 'mean', 'sd': 'sd', 'hdi_low': 'hdi_2.5%', 'hdi_high': 'hdi_97.5%'}
+
+    def __call__(self, summary_stats):
+        names = {name: summary_stats[column] for name, column in self.COLUMNS.items() if column in summary_stats}
+        names.update({'summary': summary_stats, 'abs': abs, 'min': min, 'max': max})
+        return bool(eval(self.expression, {'__builtins__': {}}, names))
+
+
+def load_run_file(path):
+    '''Reads a run file (.yaml/.yml with PyYAML, anything else as JSON).'''
+    with open(path) as f:
+        if os.path.splitext(path)[1] in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                logger.error('Reading YAML run files needs PyYAML (e.g., pip install pyyaml), or use JSON.')
+                sys.exit('Aborting')
+            run = yaml.safe_load(f)
+        else:
+            run = json.load(f)
+    missing = [key for key in ('design', 'goal', 'settings') if key not in run]
+    if missing or 'iterations' not in run['settings']:
+        logger.error('The run file %s needs design, goal, and settings (with iterations); missing: %s.'
+                     % (path, ', '.join(missing or ['settings: iterations'])))
+        sys.exit('Aborting')
+    return run
+
+
+def parse_shard(text):
+    '''Parses i/n (the i-th of n shards, counted from 1) into (i - 1, n).'''
+    try:
+        index, count = (int(x) for x in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('shards are given as i/n, e.g., 3/100')
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('the shard %s does not exist' % text)
+    return index - 1, count
+
+
+def run(args):
+    from .tvatojpower import sim_and_fit, hierarchical_model_noncentered
+    run_file = load_run_file(args.run_file)
+    settings = dict(run_file['settings'])
+    outfile = settings.pop('outfile', os.path.splitext(args.run_file)[0] + '.csv')
+    if args.outfile is not None:
+        outfile = args.outfile
+    if args.processes is not None:
+        settings['processes'] = args.processes
+    if args.shard is not None:
+        if settings.get('seed') is None:
+            logger.error('Sharded runs need a seed in the settings, from which all shards derive their iterations.')
+            sys.exit('Aborting')
+        if settings.get('stop_hdi_width') is not None or settings.get('target_power') is not None:
+            logger.error('The stopping rules would only see the iterations of one shard; '
+                         'remove stop_hdi_width and target_power to run shards.')
+            sys.exit('Aborting')
+        if args.outfile is None:
+            base, extension = os.path.splitext(outfile)
+            outfile = '%s.shard%d-%d%s' % (base, args.shard[0] + 1, args.shard[1], extension)
+        settings['shard'] = args.shard
+    power, hdi, attempts = sim_and_fit(run_file['design'], hierarchical_model_noncentered,
+                                       condition_func=GoalExpression(run_file['goal']),
+                                       outfile=outfile, resume=args.resume, **settings)
+    if hdi is not None:
+        print('Power: %.3f [95 %% HDI: %.3f to %.3f] after %d iterations, written to %s'
+              % (power, hdi[0], hdi[1], attempts, outfile))
+
+
+def merge(args):
+    '''Combines the outputs of shards into the output of the whole run: the rows are sorted by
+    iteration and the running power estimates are recomputed over all iterations.'''
+    import pandas as pd
+    from .power import power_hdi
+    from .results import read_results, open_results
+    frames = [read_results(path) for path in args.files]
+    seen = set()
+    for path, frame in zip(args.files, frames):
+        if seen & set(frame['iteration']):
+            logger.error('%s contains iterations of another file (e.g., of the same shard).' % path)
+            sys.exit('Aborting')
+        seen |= set(frame['iteration'])
+    out_df = pd.concat(frames).sort_values('iteration', kind='stable')
+    success = out_df.groupby('iteration', sort=True)['success'].first()
+    missing = sorted(set(range(1, success.index.max() + 1)) - seen)
+    if missing:
+        logger.warning('[MERGE] %d iterations are missing (e.g., iteration %d); the estimate is based on the others.'
+                       % (len(missing), missing[0]))
+    num_success = success.cumsum()
+    attempts = pd.Series(range(1, len(success) + 1), index=success.index)
+    hdis = power_hdi(num_success.values, attempts.values)
+    out_df['power_est'] = out_df['iteration'].map(num_success / attempts)
+    out_df['power_hdi_2.5%'] = out_df['iteration'].map(pd.Series(hdis[:, 0], index=success.index))
+    out_df['power_hdi_97.5%'] = out_df['iteration'].map(pd.Series(hdis[:, 1], index=success.index))
+    output = open_results(args.outfile)
+    output.append(out_df)
+    output.close()
+    print('Power: %.3f [95 %% HDI: %.3f to %.3f] after %d iterations from %d files, written to %s'
+          % (num_success.iloc[-1] / len(success), hdis[-1, 0], hdis[-1, 1], len(success), len(args.files),
+             args.outfile))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tvatojpower', description='Power analyses with the TVATOJ model')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run_parser = commands.add_parser('run', help='Run the power simulation of a run file (YAML or JSON)')
+    run_parser.add_argument('run_file')
+    run_parser.add_argument('--shard', type=parse_shard, help='Only run the i-th of n parts of the iterations, e.g., 3/100')
+    run_parser.add_argument('--outfile', help='Output file (default: from the settings, or the run file name)')
+    run_parser.add_argument('--processes', type=int, help='Number of worker processes (see sim_and_fit)')
+    run_parser.add_argument('--resume', action='store_true', help='Resume an interrupted run from its checkpoint')
+    run_parser.set_defaults(func=run)
+    merge_parser = commands.add_parser('merge', help='Merge the outputs of shards into one power estimate')
+    merge_parser.add_argument('files', nargs='+')
+    merge_parser.add_argument('--outfile', default='merged.csv')
+    merge_parser.set_defaults(func=merge)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+A compiled NUTS sampler for hierarchical_model_noncentered (the 'numba' backend). The model has
+a fixed form, so its log density and gradient are written out by hand: normal priors on C_mu and
+wp_mu, half-Cauchy priors on C_sd and wp_sd (sampled on the log scale), the non-centered C_e and
+wp_e, and the binomial likelihood of the TOJ counts (as in likelihood.py). With Numba, these and
+the sampler itself are compiled to native code, and all chains run in one process (in threads if
+cores > 1), without any Theano graph or chain processes.
+
+The sampler is the multinomial NUTS of Stan (Betancourt, 2017), built iteratively (as in NumPyro),
+with Stan's warm-up: the step size is adapted by dual averaging throughout, the diagonal mass
+matrix in doubling windows after an initial buffer. Each chain has its own random stream (seeded
+from the chain seeds of pymc3), so results do not depend on the number of threads. The draws are
+returned with the variables of the model (as in the mle backend) and the sample stats diverging,
+tree_depth, and n_steps.
+'''
+
+import sys
+import math
+import logging
+
+import numpy as np
+
+from .mle import _probability_and_jacobian, _derived_variables
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numba
+    _jit = numba.njit(cache=True)
+    prange = numba.prange
+except ImportError:
+    numba = None
+    def _jit(func):
+        return func
+    prange = range
+
+# The priors of hierarchical_model_noncentered: (mean, sd) of the normal priors on C_mu and wp_mu,
+# and the beta of the half-Cauchy priors on C_sd and wp_sd
+C_MU_PRIOR = (0.080, 0.050)
+WP_MU_PRIOR = (0.5, 0.2)
+C_SD_BETA = 0.1
+WP_SD_BETA = 0.2
+
+MODEL_VARS = ('C_mu', 'C_sd', 'wp_mu', 'wp_sd', 'wp_e', 'C_e')
+
+
+# Layout of the parameter vector: C_mu, log C_sd, wp_mu, log wp_sd, wp_e (participants x num_wp),
+# C_e (participants x num_C). Returns the log density (up to constants) and writes its gradient into grad.
+# work holds the C and wp of the participants, their gradients, and log wp and log (1 - wp) (6 x participants x 2).
+@_jit
+def _logp_and_grad(x, grad, work, p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants):
+    wp_e0 = 2 * num_C + 2 * num_wp
+    C_e0 = wp_e0 + num_participants * num_wp
+    logp = 0.0
+    for i in range(len(x)):
+        grad[i] = 0.0
+
+    # Priors of the group-level parameters (with the Jacobian of the log transform of the SDs)
+    for j in range(num_C):
+        z = (x[j] - C_MU_PRIOR[0]) / C_MU_PRIOR[1]
+        logp -= 0.5 * z * z
+        grad[j] = -z / C_MU_PRIOR[1]
+        s2 = (math.exp(x[num_C + j]) / C_SD_BETA)**2
+        logp += x[num_C + j] - math.log1p(s2)
+        grad[num_C + j] = 1 - 2 * s2 / (1 + s2)
+    for j in range(num_wp):
+        z = (x[2 * num_C + j] - WP_MU_PRIOR[0]) / WP_MU_PRIOR[1]
+        logp -= 0.5 * z * z
+        grad[2 * num_C + j] = -z / WP_MU_PRIOR[1]
+        s2 = (math.exp(x[2 * num_C + num_wp + j]) / WP_SD_BETA)**2
+        logp += x[2 * num_C + num_wp + j] - math.log1p(s2)
+        grad[2 * num_C + num_wp + j] = 1 - 2 * s2 / (1 + s2)
+    for i in range(wp_e0, len(x)):
+        logp -= 0.5 * x[i] * x[i]
+        grad[i] = -x[i]
+
+    # The parameters of the participants, clipped as in the model
+    C_sd0, C_sd1 = math.exp(x[num_C]), math.exp(x[2 * num_C - 1])
+    wp_sd0, wp_sd1 = math.exp(x[2 * num_C + num_wp]), math.exp(x[wp_e0 - 1])
+    for p in range(num_participants):
+        for j in range(num_C):
+            work[0, p, j] = min(max(x[j] + x[C_e0 + p * num_C + j] * (C_sd1 if j else C_sd0), 0.0001), 0.9999)
+            work[2, p, j] = 0.0
+        for j in range(num_wp):
+            work[1, p, j] = min(max(x[2 * num_C + j] + x[wp_e0 + p * num_wp + j] * (wp_sd1 if j else wp_sd0),
+                                    0.0001), 0.9999)
+            work[3, p, j] = 0.0
+            work[4, p, j] = math.log(work[1, p, j])
+            work[5, p, j] = math.log1p(-work[1, p, j])
+
+    # Likelihood of the rows (see likelihood.py), padded rows have n = 0. The share of the trailing
+    # stimulus, trail / total, is wp or 1 - wp, so only two transcendental functions remain per row.
+    for r in range(len(SOA)):
+        if n[r] == 0:
+            continue
+        p = p_id[r]
+        C = work[0, p, C_col[r]]
+        wp = work[1, p, wp_col[r]]
+        vp = C * wp
+        vr = C * (1 - wp)
+        probe_leads = SOA[r] <= 0
+        lead, trail = (vp, vr) if probe_leads else (vr, vp)
+        k_trail = n[r] - k[r] if probe_leads else k[r]
+        total = lead + trail
+        abs_SOA = abs(SOA[r])
+        q = math.exp(-lead * abs_SOA) * trail / total
+        one_minus_q = max(1 - q, 2.2250738585072014e-308)
+        log_share = work[5, p, wp_col[r]] if probe_leads else work[4, p, wp_col[r]]
+        logp += k_trail * (log_share - lead * abs_SOA) + (n[r] - k_trail) * math.log(one_minus_q)
+        weight = (k_trail - n[r] * q) / one_minus_q
+        d_lead = weight * (-abs_SOA - 1 / total)
+        d_trail = weight * (1 / trail - 1 / total)
+        d_vp, d_vr = (d_lead, d_trail) if probe_leads else (d_trail, d_lead)
+        work[2, p, C_col[r]] += d_vp * wp + d_vr * (1 - wp)
+        work[3, p, wp_col[r]] += (d_vp - d_vr) * C
+
+    # Back to the free parameters (the gradient is zero where the clipping is active)
+    for p in range(num_participants):
+        for j in range(num_C):
+            if 0.0001 < work[0, p, j] < 0.9999:
+                sd = C_sd1 if j else C_sd0
+                e = x[C_e0 + p * num_C + j]
+                grad[j] += work[2, p, j]
+                grad[C_e0 + p * num_C + j] += work[2, p, j] * sd
+                grad[num_C + j] += work[2, p, j] * e * sd
+        for j in range(num_wp):
+            if 0.0001 < work[1, p, j] < 0.9999:
+                sd = wp_sd1 if j else wp_sd0
+                e = x[wp_e0 + p * num_wp + j]
+                grad[2 * num_C + j] += work[3, p, j]
+                grad[wp_e0 + p * num_wp + j] += work[3, p, j] * sd
+                grad[2 * num_C + num_wp + j] += work[3, p, j] * e * sd
+    return logp
+
+
+# A xorshift64* generator per chain (state: a uint64 array of length 1)
+@_jit
+def _uniform(state):
+    x = state[0]
+    x ^= x >> np.uint64(12)
+    x ^= x << np.uint64(25)
+    x ^= x >> np.uint64(27)
+    state[0] = x
+    return ((x * np.uint64(0x2545F4914F6CDD1D)) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+@_jit
+def _normal(state):
+    return math.sqrt(-2 * math.log(1 - _uniform(state))) * math.cos(2 * math.pi * _uniform(state))
+
+
+@_jit
+def _log_add_exp(a, b):
+    if a == -np.inf:
+        return b
+    if b == -np.inf:
+        return a
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+@_jit
+def _kinetic(r, inv_mass):
+    energy = 0.0
+    for i in range(len(r)):
+        energy += inv_mass[i] * r[i] * r[i]
+    return 0.5 * energy
+
+
+# The generalized U-turn criterion of the trajectory with the end momenta r_left and r_right and
+# the sum r_sum of all its momenta (Betancourt, 2017, A.4.2)
+@_jit
+def _is_turning(r_left, r_right, r_sum, inv_mass):
+    left = 0.0
+    right = 0.0
+    for i in range(len(r_sum)):
+        rho = r_sum[i] - 0.5 * (r_left[i] + r_right[i])
+        left += inv_mass[i] * r_left[i] * rho
+        right += inv_mass[i] * r_right[i] * rho
+    return left <= 0 or right <= 0
+
+
+# The checkpoints a leaf of an iteratively built subtree is checked against (as in NumPyro): the
+# number of set bits of leaf >> 1 and the number of trailing ones of leaf
+@_jit
+def _checkpoint_range(leaf):
+    idx_max = 0
+    m = leaf >> 1
+    while m:
+        idx_max += m & 1
+        m >>= 1
+    trailing_ones = 0
+    m = leaf
+    while m & 1:
+        trailing_ones += 1
+        m >>= 1
+    return idx_max - trailing_ones + 1, idx_max
+
+
+@_jit
+def _leapfrog(x, r, grad, step_size, inv_mass, work, p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants):
+    for i in range(len(x)):
+        r[i] += 0.5 * step_size * grad[i]
+        x[i] += step_size * inv_mass[i] * r[i]
+    logp = _logp_and_grad(x, grad, work, p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants)
+    for i in range(len(x)):
+        r[i] += 0.5 * step_size * grad[i]
+    return logp
+
+
+# One chain: tune warm-up iterations followed by the draws, starting from x. Writes the draws
+# (draws x dim), their stats (draws x (diverging, tree depth, leapfrog steps)), and the leapfrog
+# steps of the warm-up and the final step size (tune_stats).
+@_jit
+def _run_chain(x, samples, stats, tune_stats, tune, target_accept, max_depth, state,
+               p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants):
+    dim = len(x)
+    work = np.zeros((6, num_participants, 2))
+    grad = np.zeros(dim)
+    logp = _logp_and_grad(x, grad, work, p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants)
+    r0 = np.zeros(dim)
+    x_left, r_left, grad_left = np.zeros(dim), np.zeros(dim), np.zeros(dim)
+    x_right, r_right, grad_right = np.zeros(dim), np.zeros(dim), np.zeros(dim)
+    x_end, r_end, grad_end = np.zeros(dim), np.zeros(dim), np.zeros(dim)
+    x_sub, grad_sub = np.zeros(dim), np.zeros(dim)
+    r_sum, r_sum_sub = np.zeros(dim), np.zeros(dim)
+    r_ckpts, r_sum_ckpts = np.zeros((max_depth, dim)), np.zeros((max_depth, dim))
+
+    # Warm-up as in Stan: dual averaging of the step size (gamma 0.05, t0 10, kappa 0.75), and
+    # the mass matrix from the variances of doubling windows between an initial and a final buffer
+    inv_mass = np.ones(dim)
+    step_size = 0.25 / dim**0.25 # pymc3's initial step size
+    mu, s_bar, log_step_bar, da_count = math.log(10 * step_size), 0.0, 0.0, 0
+    adapt_mass = tune >= 20
+    init_buffer, term_buffer, window_size = 75, 50, 25
+    if init_buffer + term_buffer + window_size > tune:
+        init_buffer, term_buffer = int(0.15 * tune), int(0.1 * tune)
+        window_size = tune - init_buffer - term_buffer
+    window_end = init_buffer + window_size - 1
+    w_count, w_mean, w_m2 = 0, np.zeros(dim), np.zeros(dim)
+    tune_steps = 0
+
+    for it in range(tune + len(samples)):
+        for i in range(dim):
+            r0[i] = _normal(state) / math.sqrt(inv_mass[i])
+        H0 = -logp + _kinetic(r0, inv_mass)
+        x_left[:], r_left[:], grad_left[:] = x, r0, grad
+        x_right[:], r_right[:], grad_right[:] = x, r0, grad
+        r_sum[:] = r0
+        log_weight = -H0
+        logp_new = logp
+        x_new, grad_new = x.copy(), grad.copy()
+        depth, num_steps, accept_sum, diverging = 0, 0, 0.0, False
+
+        while depth < max_depth:
+            forward = _uniform(state) < 0.5
+            if forward:
+                x_end[:], r_end[:], grad_end[:] = x_right, r_right, grad_right
+            else:
+                x_end[:], r_end[:], grad_end[:] = x_left, r_left, grad_left
+            # A subtree of 2^depth leaves in that direction, with progressive multinomial sampling
+            log_weight_sub = -np.inf
+            logp_sub = logp
+            r_sum_sub[:] = 0.0
+            turning = False
+            for leaf in range(1 << depth):
+                logp_end = _leapfrog(x_end, r_end, grad_end, step_size if forward else -step_size, inv_mass, work,
+                                     p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants)
+                H = -logp_end + _kinetic(r_end, inv_mass)
+                num_steps += 1
+                if not H - H0 <= 1000: # Also catches NaN
+                    diverging = True
+                    break
+                accept_sum += min(1.0, math.exp(H0 - H))
+                log_weight_new = _log_add_exp(log_weight_sub, -H)
+                if _uniform(state) < math.exp(-H - log_weight_new):
+                    x_sub[:], grad_sub[:] = x_end, grad_end
+                    logp_sub = logp_end
+                log_weight_sub = log_weight_new
+                r_sum_sub += r_end
+                idx_min, idx_max = _checkpoint_range(leaf)
+                if leaf % 2 == 0:
+                    r_ckpts[idx_max] = r_end
+                    r_sum_ckpts[idx_max] = r_sum_sub
+                else:
+                    for c in range(idx_max, idx_min - 1, -1):
+                        if _is_turning(r_ckpts[c], r_end, r_sum_sub - r_sum_ckpts[c] + r_ckpts[c], inv_mass):
+                            turning = True
+                            break
+                if turning:
+                    break
+            if diverging or turning: # The subtree is rejected
+                break
+            # Biased progressive sampling between the old trajectory and the subtree
+            if _uniform(state) < math.exp(log_weight_sub - log_weight):
+                x_new[:], grad_new[:] = x_sub, grad_sub
+                logp_new = logp_sub
+            log_weight = _log_add_exp(log_weight, log_weight_sub)
+            r_sum += r_sum_sub
+            if forward:
+                x_right[:], r_right[:], grad_right[:] = x_end, r_end, grad_end
+            else:
+                x_left[:], r_left[:], grad_left[:] = x_end, r_end, grad_end
+            depth += 1
+            if _is_turning(r_left, r_right, r_sum, inv_mass):
+                break
+
+        x[:], grad[:] = x_new, grad_new
+        logp = logp_new
+        if it >= tune:
+            samples[it - tune] = x
+            stats[it - tune, 0] = diverging
+            stats[it - tune, 1] = depth
+            stats[it - tune, 2] = num_steps
+            continue
+
+        tune_steps += num_steps
+        da_count += 1
+        eta = 1.0 / (da_count + 10)
+        s_bar = (1 - eta) * s_bar + eta * (target_accept - accept_sum / max(num_steps, 1))
+        log_step = mu - math.sqrt(da_count) / 0.05 * s_bar
+        weight = da_count**-0.75
+        log_step_bar = weight * log_step + (1 - weight) * log_step_bar
+        step_size = math.exp(log_step)
+        if adapt_mass and init_buffer <= it < tune - term_buffer:
+            w_count += 1
+            for i in range(dim):
+                delta = x[i] - w_mean[i]
+                w_mean[i] += delta / w_count
+                w_m2[i] += delta * (x[i] - w_mean[i])
+            if it == window_end:
+                for i in range(dim): # Regularized towards 1e-3 as in Stan
+                    inv_mass[i] = (w_count / (w_count + 5.0)) * w_m2[i] / (w_count - 1) + 1e-3 * 5.0 / (w_count + 5.0)
+                w_count, w_mean[:], w_m2[:] = 0, 0.0, 0.0
+                window_size *= 2
+                window_end = it + window_size
+                if window_end + 2 * window_size >= tune - term_buffer: # The last window extends to the final buffer
+                    window_end = tune - term_buffer - 1
+                mu, s_bar, log_step_bar, da_count = math.log(10 * step_size), 0.0, 0.0, 0
+        if it == tune - 1:
+            step_size = math.exp(log_step_bar)
+    tune_stats[0] = tune_steps
+    tune_stats[1] = step_size
+
+
+# All chains, one after the other (_chains_serial) or in threads (_chains_parallel). The two are
+# separate functions, as Numba's on-disk cache does not tell apart compilations with and without
+# parallel=True of the same function.
+def _chains(x0, samples, stats, tune_stats, tune, target_accept, max_depth, states,
+            p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants):
+    for c in range(len(x0)):
+        _run_chain(x0[c].copy(), samples[c], stats[c], tune_stats[c], tune, target_accept, max_depth, states[c:c + 1],
+                   p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants)
+
+def _chains_prange(x0, samples, stats, tune_stats, tune, target_accept, max_depth, states,
+                   p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants):
+    for c in prange(len(x0)):
+        _run_chain(x0[c].copy(), samples[c], stats[c], tune_stats[c], tune, target_accept, max_depth, states[c:c + 1],
+                   p_id, C_col, wp_col, SOA, n, k, num_C, num_wp, num_participants)
+
+if numba is not None:
+    _chains_serial = numba.njit(cache=True)(_chains)
+    _chains_parallel = numba.njit(cache=True, parallel=True)(_chains_prange)
+
+
+# The start point of the chains: the test point of the model (the prior means, and the SDs at beta)
+def _start_point(num_C, num_wp, num_participants):
+    return np.concatenate([np.full(num_C, C_MU_PRIOR[0]), np.full(num_C, math.log(C_SD_BETA)),
+                           np.full(num_wp, WP_MU_PRIOR[0]), np.full(num_wp, math.log(WP_SD_BETA)),
+                           np.zeros(num_participants * (num_wp + num_C))])
+
+
+# All variables of hierarchical_model_noncentered
+def _var_names(num_wp):
+    means = ['va_diff_mean', 'vp_diff_mean', 'vr_diff_mean', 'wpa_mean', 'wp_diff_mean'] if num_wp > 1 else ['wp_mean']
+    return list(MODEL_VARS) + ['C', 'wp', 'theta', 'vp', 'vr', 'vp_mean', 'vr_mean'] + means
+
+
+def _variables(samples, arrays, num_C, num_wp, var_names):
+    # The variables of the model from the draws of the parameter vector (chains x draws x dim)
+    chains, draws, _ = samples.shape
+    num_participants = len(arrays['participant_mask'])
+    x = samples.reshape(chains * draws, -1)
+    wp_e0 = 2 * num_C + 2 * num_wp
+    C_e0 = wp_e0 + num_participants * num_wp
+    posterior = {'C_mu': x[:, :num_C], 'C_sd': np.exp(x[:, num_C:2 * num_C]),
+                 'wp_mu': x[:, 2 * num_C:2 * num_C + num_wp], 'wp_sd': np.exp(x[:, 2 * num_C + num_wp:wp_e0]),
+                 'wp_e': x[:, wp_e0:C_e0].reshape(-1, num_participants, num_wp),
+                 'C_e': x[:, C_e0:].reshape(-1, num_participants, num_C)}
+    C = np.clip(posterior['C_mu'][:, None] + posterior['C_e'] * posterior['C_sd'][:, None], 0.0001, 0.9999)
+    wp = np.clip(posterior['wp_mu'][:, None] + posterior['wp_e'] * posterior['wp_sd'][:, None], 0.0001, 0.9999)
+    posterior.update(_derived_variables(C, wp, np.asarray(arrays['participant_mask']) > 0, num_wp))
+    if 'theta' in var_names: # The psychometric function of each row
+        vp, vr = posterior['vp'], posterior['vr']
+        p_id = arrays['participant_id']
+        column = np.minimum(arrays['condition_id'], vp.shape[-1] - 1)
+        posterior['theta'] = _probability_and_jacobian(arrays['SOA'], vp[:, p_id, column], vr[:, p_id, column])[0]
+    return {name: posterior[name].reshape((chains, draws) + posterior[name].shape[1:]) for name in var_names}
+
+
+def compiled_nuts(arrays, num_C, num_wp, draws=2000, tune=1000, chains=4, cores=4, target_accept=0.85,
+                  seeds=None, max_treedepth=10, var_names=None):
+    '''Samples the posterior of hierarchical_model_noncentered with the compiled NUTS sampler.
+
+    :param arrays: The model data (see model_data), or stacked model data of K datasets (see
+                   stacked_model_data), whose posteriors are sampled independently
+    :param num_C: Number of C parameters per participant (1: single_C, 2: one per condition)
+    :param num_wp: Number of wp parameters per participant (1: single_wp, 2: one per condition)
+    :param cores: Number of threads the chains run in
+    :param seeds: The seeds of the chains (e.g., from _chain_seeds), None for fresh entropy
+    :param max_treedepth: Maximum number of doublings of a trajectory
+    :param var_names: The variables to return (default: all variables of the model)
+
+    :returns: A dict of draws (chains x draws x ..., with the dataset in the third dimension for K
+              datasets) and a dict of sample stats, as for arviz.from_dict, and the number of leapfrog
+              steps during the warm-up
+    '''
+    if numba is None:
+        logger.error('The numba backend needs Numba (e.g., pip install numba).')
+        sys.exit('Aborting')
+    batched = np.ndim(arrays['participant_mask']) == 2
+    datasets = [{name: values[d] for name, values in arrays.items()} for d in range(len(arrays['participant_mask']))] \
+        if batched else [arrays]
+    # One stream per chain and dataset, derived from the seeds of the chains (uint64, never 0)
+    states = np.random.SeedSequence(seeds).generate_state(len(datasets) * chains, np.uint64).reshape(len(datasets), chains)
+    states[states == 0] = 1
+    var_names = _var_names(num_wp) if var_names is None else list(var_names)
+    missing = [name for name in var_names if name not in _var_names(num_wp)]
+    if missing:
+        logger.error('The numba backend does not know %s.' % ', '.join(missing))
+        sys.exit('Aborting')
+    run = _chains_serial
+    if cores > 1 and chains > 1:
+        numba.set_num_threads(min(cores, numba.config.NUMBA_NUM_THREADS))
+        run = _chains_parallel
+
+    posteriors, sample_stats, tune_steps = [], [], 0
+    for d, data in enumerate(datasets):
+        num_participants = len(data['participant_mask'])
+        x0 = np.tile(_start_point(num_C, num_wp, num_participants), (chains, 1))
+        samples = np.zeros((chains, draws, x0.shape[1]))
+        stats = np.zeros((chains, draws, 3))
+        tune_stats = np.zeros((chains, 2))
+        condition_id = np.asarray(data['condition_id'], dtype=np.int64)
+        run(x0, samples, stats, tune_stats, tune, target_accept, max_treedepth, states[d],
+            np.asarray(data['participant_id'], dtype=np.int64), np.minimum(condition_id, num_C - 1),
+            np.minimum(condition_id, num_wp - 1), np.asarray(data['SOA'], dtype=float),
+            np.asarray(data['repetitions'], dtype=float), np.asarray(data['probe_first_count'], dtype=float),
+            num_C, num_wp, num_participants)
+        posteriors.append(_variables(samples, data, num_C, num_wp, var_names))
+        sample_stats.append({'diverging': stats[:, :, 0] > 0, 'tree_depth': stats[:, :, 1].astype(int),
+                             'n_steps': stats[:, :, 2].astype(int), 'step_size': np.repeat(tune_stats[:, 1:], draws, axis=1)})
+        tune_steps += int(tune_stats[:, 0].sum())
+    if not batched:
+        return posteriors[0], sample_stats[0], tune_steps
+    return ({name: np.stack([posterior[name] for posterior in posteriors], axis=2) for name in var_names},
+            {name: np.stack([stats[name] for stats in sample_stats], axis=2) for name in sample_stats[0]}, tune_steps)
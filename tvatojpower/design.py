@@ -0,0 +1,195 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Optimal placement of SOAs and allocation of repetitions. The information a TOJ judgment carries
+about C and wp of a participant depends strongly on the SOA (at SOA 0, for example, only wp is
+informative). For a fixed number of trials per participant and condition, the trials are therefore
+allocated across candidate SOAs so that the expected Fisher information (averaged over participants
+drawn from the design's distributions) is best for the goal:
+
+    'D' : the largest expected log determinant of the information about C and wp (for goals on both,
+          e.g., on vp and vr)
+    'wp': the smallest expected variance of the wp estimates (for goals on wp, e.g., wp_diff_mean)
+    'C' : the smallest expected variance of the C estimates
+
+The optimal proportions of trials are found by a multiplicative algorithm (e.g., Yu, 2010), which
+is vectorized over participants, conditions, and candidate SOAs, and then rounded to repetitions.
+The criteria are those of the per-participant estimates; the power of the resulting design should
+still be checked with sim_and_fit.
+'''
+
+import sys
+import logging
+
+import numpy as np
+
+from .mle import _probability_and_jacobian
+from .simulation import participant_parameters
+
+logger = logging.getLogger(__name__)
+
+CRITERIA = ('D', 'wp', 'C')
+
+
+def soa_information(SOAs, C, wp):
+    '''Fisher information of a single judgment about (C, wp) at each SOA.
+
+    :param SOAs: The SOAs in ms
+    :param C: Rates C (in 1/ms) of any shape, e.g., participants x conditions
+    :param wp: Weights wp of the same shape as C
+
+    :returns: Information matrices of shape C.shape + (len(SOAs), 2, 2)
+    '''
+    F = _information_entries(SOAs, C, wp)
+    return np.stack([np.stack([F[0], F[1]], axis=-1), np.stack([F[1], F[2]], axis=-1)], axis=-2)
+
+
+# The entries (C C, C wp, wp wp) of the information matrices of soa_information, stacked in front
+def _information_entries(SOAs, C, wp):
+    SOAs = np.asarray(SOAs, dtype=float)
+    C = np.clip(np.asarray(C, dtype=float), 0.0001, 0.9999)[..., None] # Clipped as in the model
+    wp = np.clip(np.asarray(wp, dtype=float), 0.0001, 0.9999)[..., None]
+    p, dp_dvp, dp_dvr = _probability_and_jacobian(SOAs, C * wp, C * (1 - wp))
+    p = np.clip(p, 1e-12, 1 - 1e-12)
+    dp_dC = dp_dvp * wp + dp_dvr * (1 - wp)
+    dp_dwp = (dp_dvp - dp_dvr) * C
+    return np.stack([dp_dC**2, dp_dC * dp_dwp, dp_dwp**2]) / (p * (1 - p))
+
+
+# The criterion (smaller is better) of the information matrices with the entries M (3 x n, see 
+# _information_entries), averaged over all n participants (and conditions), and its sensitivities 
+# to more trials at the candidate SOAs (with information entries F, 3 x n x SOAs), i.e., the decrease 
+# of the criterion per unit of weight. The 2 x 2 matrices are inverted in closed form.
+def _criterion(M, F, criterion):
+    a, b, d = M
+    det = a * d - b**2
+    if criterion == 'D': # -log det M, with the sensitivities trace(M^-1 I)
+        value = -np.log(det).mean()
+        coefficients = np.stack([d, -2 * b, a]) / det
+    elif criterion == 'C': # (M^-1)_CC, with the sensitivities (M^-1 I M^-1)_CC
+        value = (d / det).mean()
+        coefficients = np.stack([d**2, -2 * b * d, b**2]) / det**2
+    else: # The same for wp
+        value = (a / det).mean()
+        coefficients = np.stack([b**2, -2 * a * b, a**2]) / det**2
+    return value, np.einsum('kn,kns->s', coefficients, F) / len(a)
+
+
+def _check_criterion(criterion):
+    if criterion not in CRITERIA:
+        logger.error('Unknown design criterion %s. Please use one of %s.' % (criterion, ', '.join(CRITERIA)))
+        sys.exit('Aborting')
+
+
+def _participant_draws(design, draws, rng):
+    # Participants drawn from the design's distributions (or its given participants)
+    if 'C_sub' in design:
+        return participant_parameters(design)
+    return participant_parameters(dict(design, num_participants=draws), rng)
+
+
+# The criterion of a design for the participants C and wp (participants x conditions)
+def _design_criterion(design, C, wp, criterion):
+    F = _information_entries(design['SOAs'], C, wp).reshape(3, -1, len(design['SOAs']))
+    return _criterion(F @ np.asarray(design['repetitions'], dtype=float), F, criterion)[0]
+
+
+def expected_criterion(design, criterion='D', draws=1000, rng=None):
+    '''The expected criterion of a design: the variance of the wp or C estimates, or the negative log
+    determinant of the information (criterion 'D'), of a participant in a condition (smaller is better).
+
+    :param design: A design dict as used by sim_and_fit
+    :param draws: Number of participants drawn from the design's distributions
+    '''
+    _check_criterion(criterion)
+    C, wp = _participant_draws(design, draws, np.random.default_rng(rng))
+    return _design_criterion(design, C, wp, criterion)
+
+
+def relative_efficiency(design, reference, criterion='D', draws=1000, rng=None):
+    '''How many times as informative design is as reference, i.e., the factor by which the number of
+    trials of reference would have to grow to match design (the same participants are used for both).'''
+    _check_criterion(criterion)
+    C, wp = _participant_draws(reference, draws, np.random.default_rng(rng))
+    return _efficiency(_design_criterion(design, C, wp, criterion), _design_criterion(reference, C, wp, criterion),
+                       criterion)
+
+
+def _efficiency(value, reference_value, criterion):
+    if criterion == 'D': # The log determinant of the 2 x 2 information grows by 2 log(trials)
+        return float(np.exp((reference_value - value) / 2))
+    return float(reference_value / value)
+
+
+def _round_repetitions(weights, trials):
+    # Largest remainders: every SOA gets the floor of its share, the remaining trials go to the
+    # largest remainders
+    shares = weights * trials
+    repetitions = np.floor(shares).astype(int)
+    remainders = shares - repetitions
+    repetitions[np.argsort(-remainders)[:trials - repetitions.sum()]] += 1
+    return repetitions
+
+
+def optimal_design(design, criterion='D', candidate_SOAs=None, trials=None, min_repetitions=0,
+                   draws=1000, iterations=2000, tol=1e-3, rng=None):
+    '''Allocates a fixed number of trials across candidate SOAs, so that the expected information of
+    the design is best for the goal (see the criteria above).
+
+    :param design: A design dict as used by sim_and_fit, whose distributions of C and wp are used
+    :param criterion: 'D', 'wp', or 'C'. Note that the wp criterion alone puts (nearly) all trials at
+                      SOA 0, where the judgments depend on wp only, and C could not be estimated.
+                      Combine it with min_repetitions, or use 'D'.
+    :param candidate_SOAs: The SOAs (in ms) that can be used (default: every 10 ms between the
+                           smallest and the largest SOA of design)
+    :param trials: Number of trials per participant and condition (default: as in design)
+    :param min_repetitions: Number of repetitions every candidate SOA gets at least
+    :param draws: Number of participants drawn from the design's distributions
+    :param iterations: Maximum number of iterations of the multiplicative algorithm
+    :param tol: The algorithm stops once no SOA could improve the criterion more than 1 + tol times
+                the average (the general equivalence theorem)
+    :param rng: Seed of the participant draws
+
+    :returns: A copy of design with the optimal SOAs and repetitions (SOAs without trials are dropped)
+    '''
+    _check_criterion(criterion)
+    if candidate_SOAs is None:
+        candidate_SOAs = np.arange(min(design['SOAs']), max(design['SOAs']) + 5, 10.0)
+    candidate_SOAs = np.asarray(candidate_SOAs, dtype=float)
+    trials = int(np.sum(design['repetitions'])) if trials is None else int(trials)
+    free_trials = trials - min_repetitions * len(candidate_SOAs)
+    if free_trials < 0:
+        logger.error('%d trials do not suffice for %d repetitions at each of %d SOAs.'
+                     % (trials, min_repetitions, len(candidate_SOAs)))
+        sys.exit('Aborting')
+    C, wp = _participant_draws(design, draws, np.random.default_rng(rng))
+    F = _information_entries(candidate_SOAs, C, wp).reshape(3, -1, len(candidate_SOAs))
+
+    # The weights (proportions) of the free trials are optimized; the criterion of the design
+    # changes with them in proportion to the sensitivities. The D-criterion converges with an
+    # exponent of 1, the variances are safer with 1/2.
+    exponent = 1.0 if criterion == 'D' else 0.5
+    weights = np.full(len(candidate_SOAs), 1.0 / len(candidate_SOAs))
+    for iteration in range(iterations):
+        value, sensitivity = _criterion(F @ (min_repetitions + free_trials * weights), F, criterion)
+        ratio = sensitivity / (weights @ sensitivity)
+        if ratio.max() < 1 + tol:
+            break
+        weights = weights * ratio**exponent
+        weights /= weights.sum()
+    else:
+        logger.warning('[DESIGN] The allocation did not converge in %d iterations (max. ratio %.4f).'
+                       % (iterations, ratio.max()))
+
+    repetitions = min_repetitions + _round_repetitions(weights, free_trials)
+    used = repetitions > 0
+    optimized = dict(design, SOAs=[float(SOA) for SOA in candidate_SOAs[used]],
+                     repetitions=[int(reps) for reps in repetitions[used]])
+    logger.info('[DESIGN] %d trials on %d SOAs: %s' % (trials, used.sum(),
+                ', '.join('%g (%d)' % (SOA, reps) for SOA, reps in zip(optimized['SOAs'], optimized['repetitions']))))
+    logger.info('[DESIGN] Relative efficiency (criterion %s) compared with the given design: %.2f'
+                % (criterion, _efficiency(_design_criterion(optimized, C, wp, criterion),
+                                          _design_criterion(design, C, wp, criterion), criterion)))
+    return optimized
@@ -0,0 +1,135 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+A fused binomial log-likelihood of TOJ counts under the TVATOJ psychometric function, with
+a hand-derived gradient. It replaces computing theta for all rows (both branches of the
+psychometric function, masked by the sign of the SOA) and passing it to pymc3.Binomial.
+
+In each row, one stimulus leads by |SOA| ms. The probability that the trailing stimulus
+is perceived first is a simple product, so its logarithm is computed directly:
+
+    log q = -v_lead * |SOA| + log(v_trail) - log(v_lead + v_trail)
+
+and the log-likelihood is k_trail * log(q) + (n - k_trail) * log(1 - q), up to the constant
+binomial coefficients. The probe leads at SOA <= 0 (then k_trail = n - k), the reference at SOA > 0
+(then k_trail = k). With d log q / d v_lead = -|SOA| - 1 / (v_lead + v_trail) and
+d log q / d v_trail = 1 / v_trail - 1 / (v_lead + v_trail), the gradient of a row is
+
+    (k_trail - n * q) / (1 - q) * d log q / d v
+
+The second derivatives (needed, e.g., by pymc3.find_hessian for the Laplace approximation) follow
+with d2 log q / d v_lead2 = d2 log q / d v_lead d v_trail = 1 / (v_lead + v_trail)^2 and
+d2 log q / d v_trail2 = 1 / (v_lead + v_trail)^2 - 1 / v_trail^2:
+
+    (k_trail - n) * q / (1 - q)^2 * d log q / d v * d log q / d v'
+    + (k_trail - n * q) / (1 - q) * d2 log q / d v d v'
+'''
+
+from numpy import abs, log, exp, expm1, maximum, where, array, finfo
+import theano
+import theano.tensor as tt
+
+
+def _rows(vp, vr, SOA, n, k):
+    probe_leads = SOA <= 0
+    lead = where(probe_leads, vp, vr)
+    trail = where(probe_leads, vr, vp)
+    k_trail = where(probe_leads, n - k, k)
+    total = lead + trail
+    log_q = -lead * abs(SOA) + log(trail) - log(total)
+    one_minus_q = maximum(-expm1(log_q), finfo(float).tiny)
+    return probe_leads, abs(SOA), lead, trail, total, k_trail, log_q, one_minus_q
+
+
+def toj_binomial_logp(vp, vr, SOA, n, k):
+    '''Log-likelihood (up to constants) of k probe-first judgments in n trials per row,
+    given the probe and reference rates vp and vr (in 1/ms) and the SOAs (in ms) of the rows.'''
+    _, _, _, _, _, k_trail, log_q, one_minus_q = _rows(vp, vr, SOA, n, k)
+    return (k_trail * log_q + (n - k_trail) * log(one_minus_q)).sum()
+
+
+def toj_binomial_logp_grad(vp, vr, SOA, n, k):
+    '''Gradient of toj_binomial_logp with respect to vp and vr (one entry per row).'''
+    return toj_binomial_logp_and_grad(vp, vr, SOA, n, k)[1:]
+
+
+def toj_binomial_logp_and_grad(vp, vr, SOA, n, k):
+    '''toj_binomial_logp and toj_binomial_logp_grad from one pass over the rows.'''
+    probe_leads, abs_SOA, lead, trail, total, k_trail, log_q, one_minus_q = _rows(vp, vr, SOA, n, k)
+    logp = (k_trail * log_q + (n - k_trail) * log(one_minus_q)).sum()
+    weight = (k_trail - n * exp(log_q)) / one_minus_q
+    d_lead = weight * (-abs_SOA - 1 / total)
+    d_trail = weight * (1 / trail - 1 / total)
+    return logp, where(probe_leads, d_lead, d_trail), where(probe_leads, d_trail, d_lead)
+
+
+def toj_binomial_logp_hessian(vp, vr, SOA, n, k):
+    '''Second derivatives of toj_binomial_logp with respect to vp and vr (one entry per row, as
+    each row depends on its own rates only): d2/dvp2, d2/dvp dvr, and d2/dvr2.'''
+    probe_leads, abs_SOA, lead, trail, total, k_trail, log_q, one_minus_q = _rows(vp, vr, SOA, n, k)
+    q = exp(log_q)
+    weight = (k_trail - n * q) / one_minus_q
+    curvature = (k_trail - n) * q / one_minus_q / one_minus_q
+    d_lead, d_trail = -abs_SOA - 1 / total, 1 / trail - 1 / total
+    total_2 = 1 / total ** 2
+    h_lead = curvature * d_lead ** 2 + weight * total_2
+    h_trail = curvature * d_trail ** 2 + weight * (total_2 - 1 / trail ** 2)
+    h_cross = curvature * d_lead * d_trail + weight * total_2
+    return where(probe_leads, h_lead, h_trail), h_cross, where(probe_leads, h_trail, h_lead)
+
+
+class TOJBinomialLogp(theano.Op):
+    '''Theano op of toj_binomial_logp_and_grad. Inputs: vp, vr, SOA, n, k (vectors over data rows);
+    outputs: the log-likelihood and its derivatives with respect to vp and vr. The gradient of the
+    log-likelihood is the op's own derivative outputs, so the rows are evaluated once for both.'''
+    __props__ = ()
+
+    def make_node(self, vp, vr, SOA, n, k):
+        inputs = [tt.as_tensor_variable(x) for x in (vp, vr, SOA, n, k)]
+        return theano.Apply(self, inputs, [tt.dscalar(), tt.dvector(), tt.dvector()])
+
+    def perform(self, node, inputs, outputs):
+        logp, d_vp, d_vr = toj_binomial_logp_and_grad(*inputs)
+        outputs[0][0] = array(logp, dtype='float64')
+        outputs[1][0] = d_vp.astype('float64')
+        outputs[2][0] = d_vr.astype('float64')
+
+    def L_op(self, inputs, outputs, output_grads):
+        # Unused outputs (e.g., the derivatives, unless the Hessian is needed) contribute nothing
+        g_logp, g_vp, g_vr = (None if isinstance(g.type, theano.gradient.DisconnectedType) else g
+                              for g in output_grads)
+        grads = [tt.zeros_like(inputs[0]), tt.zeros_like(inputs[1])]
+        if g_logp is not None:
+            grads = [grads[0] + g_logp * outputs[1], grads[1] + g_logp * outputs[2]]
+        if g_vp is not None or g_vr is not None:
+            h_pp, h_pr, h_rr = TOJBinomialLogpHessian()(*inputs)
+            g_vp = tt.zeros_like(inputs[0]) if g_vp is None else g_vp
+            g_vr = tt.zeros_like(inputs[1]) if g_vr is None else g_vr
+            grads = [grads[0] + g_vp * h_pp + g_vr * h_pr, grads[1] + g_vp * h_pr + g_vr * h_rr]
+        return grads + [theano.gradient.disconnected_type() for _ in inputs[2:]]
+
+    def connection_pattern(self, node):
+        return [[True] * 3, [True] * 3, [False] * 3, [False] * 3, [False] * 3] # The data are constant
+
+
+class TOJBinomialLogpHessian(theano.Op):
+    '''Theano op of toj_binomial_logp_hessian (without a gradient of its own).'''
+    __props__ = ()
+
+    def make_node(self, vp, vr, SOA, n, k):
+        inputs = [tt.as_tensor_variable(x) for x in (vp, vr, SOA, n, k)]
+        return theano.Apply(self, inputs, [tt.dvector(), tt.dvector(), tt.dvector()])
+
+    def perform(self, node, inputs, outputs):
+        for output, h in zip(outputs, toj_binomial_logp_hessian(*inputs)):
+            output[0] = h.astype('float64')
+
+
+toj_binomial_logp_op = TOJBinomialLogp()
+
+
+def toj_binomial_logp_tensor(vp, vr, SOA, n, k):
+    '''The log-likelihood of toj_binomial_logp_op, as a Theano scalar (e.g., for pymc3.Potential).'''
+    return toj_binomial_logp_op(vp, vr, SOA, n, k)[0]
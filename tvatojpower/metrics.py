@@ -0,0 +1,80 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Timing and sampler instrumentation of power runs. Every iteration produces one metrics record
+(a flat dict) with the wall time of its phases (in seconds, keys ending in _s), estimates of the
+time spent tuning and drawing (keys ending in _s_est), and counters of the sampler, such as
+divergences, gradient evaluations, tree depths, and the ESS per second.
+'''
+
+from contextlib import contextmanager
+from time import perf_counter
+
+
+# Columns of the metrics files, in their order
+METRICS_COLUMNS = ['backend', 'simulate_s', 'set_data_s', 'sample_s', 'tune_s_est', 'draws_s_est', 'summary_s',
+                   'condition_s', 'hdi_s', 'write_s', 'divergences', 'grad_evals', 'tune_grad_evals',
+                   'mean_tree_depth', 'max_tree_depth', 'min_ess_bulk', 'ess_per_s']
+
+
+@contextmanager
+def timed(metrics, phase):
+    '''Adds the wall time of the enclosed block to metrics[phase + '_s'].'''
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics[phase + '_s'] = metrics.get(phase + '_s', 0.0) + perf_counter() - start
+
+
+class SamplingMonitor:
+    '''Callback for pymc3.sample that counts the NUTS work of all draws, including the tuning
+    draws, which are not kept in the trace.'''
+
+    def __init__(self):
+        self.tune_grad_evals = 0
+        self.draw_grad_evals = 0
+        self.tree_depths = []
+
+    def __call__(self, trace, draw):
+        stats = draw.stats[0] if draw.stats else {}
+        if 'tree_size' not in stats:
+            return
+        if draw.tuning:
+            self.tune_grad_evals += int(stats['tree_size'])
+        else:
+            self.draw_grad_evals += int(stats['tree_size'])
+            self.tree_depths.append(int(stats['depth']))
+
+
+def sampling_metrics(metrics, monitor, trace, summary_stats):
+    '''Adds the sampler counters to metrics. tune_s_est and draws_s_est are estimates, not
+    measurements: the sampling time is split into tuning and drawing in proportion to their
+    gradient evaluations, which dominate the cost of NUTS (parallel chains tune and draw at
+    overlapping times, so there is no single time at which tuning ends). The compiled
+    NUTS (backend numba) records the counters in the sample stats of its trace instead.'''
+    counters = None
+    if monitor is not None and monitor.tree_depths:
+        counters = monitor.tune_grad_evals, monitor.draw_grad_evals, monitor.tree_depths
+    elif 'n_steps' in getattr(trace, 'sample_stats', ()):
+        stats = trace.sample_stats
+        counters = (stats.attrs['tune_grad_evals'], int(stats['n_steps'].sum()), 
+                    [int(depth) for depth in stats['tree_depth'].values.ravel()])
+        metrics['divergences'] = int(stats['diverging'].sum())
+    if counters is not None:
+        tune_grad_evals, draw_grad_evals, tree_depths = counters
+        grad_evals = tune_grad_evals + draw_grad_evals
+        metrics['grad_evals'] = grad_evals
+        metrics['tune_grad_evals'] = tune_grad_evals
+        metrics['tune_s_est'] = metrics['sample_s'] * tune_grad_evals / grad_evals
+        metrics['draws_s_est'] = metrics['sample_s'] - metrics['tune_s_est']
+        metrics['mean_tree_depth'] = sum(tree_depths) / len(tree_depths)
+        metrics['max_tree_depth'] = max(tree_depths)
+    if hasattr(trace, 'get_sampler_stats') and 'diverging' in getattr(trace, 'stat_names', ()):
+        metrics['divergences'] = int(trace.get_sampler_stats('diverging').sum())
+    if 'ess_bulk' in summary_stats:
+        metrics['min_ess_bulk'] = float(summary_stats['ess_bulk'].min())
+        metrics['ess_per_s'] = metrics['min_ess_bulk'] / metrics['sample_s']
+    return metrics
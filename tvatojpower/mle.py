@@ -0,0 +1,130 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+A fast estimator of the TVATOJ model without MCMC, for screening designs. The C and wp of all
+participants are fitted at once by Fisher scoring (log C and logit wp, with a weak normal prior
+that keeps the estimates finite if a participant's judgments are all alike). The estimates and their
+covariances (inverse Fisher information) yield normal draws of the participant parameters, from
+which the same variables as in hierarchical_model_noncentered are computed. The group-level C_mu,
+C_sd, wp_mu, and wp_sd are estimated from the spread of the participants (empirical Bayes style),
+so they are rough approximations of their posteriors in the hierarchical model.
+'''
+
+import numpy as np
+
+# Weak priors on log C and logit wp (means and SDs)
+PRIOR_LOG_C = (np.log(0.08), 1.0)
+PRIOR_LOGIT_WP = (0.0, 1.0)
+
+
+def _probability_and_jacobian(SOA, vp, vr):
+    '''The psychometric function and its derivatives with respect to vp and vr (per row).'''
+    probe_leads = SOA <= 0
+    abs_SOA = np.abs(SOA)
+    total = vp + vr
+    E = np.exp(-np.where(probe_leads, vp, vr) * abs_SOA)
+    p = np.where(probe_leads, 1 - E * vr / total, E * vp / total)
+    lead_term = E * (abs_SOA * total + 1) / total**2
+    trail_term = E / total**2
+    dp_dvp = np.where(probe_leads, vr * lead_term, vr * trail_term)
+    dp_dvr = np.where(probe_leads, -vp * trail_term, -vp * lead_term)
+    return p, dp_dvp, dp_dvr
+
+
+def fit_participants(arrays, num_C, num_wp, iterations=50, tol=1e-8):
+    '''Fits C and wp of all participants.
+
+    :param arrays: The model data (see model_data)
+    :param num_C: Number of C parameters per participant (1: single_C, 2: one per condition)
+    :param num_wp: Number of wp parameters per participant (1: single_wp, 2: one per condition)
+
+    :returns: The estimates (participants x (num_C + num_wp), log C followed by logit wp)
+              and their covariances (participants x (num_C + num_wp) x (num_C + num_wp))
+    '''
+    num_participants = len(arrays['participant_mask'])
+    K = num_C + num_wp
+    p_id = arrays['participant_id']
+    C_col = np.minimum(arrays['condition_id'], num_C - 1)
+    wp_col = num_C + np.minimum(arrays['condition_id'], num_wp - 1)
+    SOA = np.asarray(arrays['SOA'], dtype=float)
+    n = np.asarray(arrays['repetitions'], dtype=float)
+    k = np.asarray(arrays['probe_first_count'], dtype=float)
+    rows = np.arange(len(SOA))
+
+    prior_mean = np.array([PRIOR_LOG_C[0]] * num_C + [PRIOR_LOGIT_WP[0]] * num_wp)
+    prior_precision = np.diag([PRIOR_LOG_C[1]**-2] * num_C + [PRIOR_LOGIT_WP[1]**-2] * num_wp)
+    theta = np.tile(prior_mean, (num_participants, 1))
+
+    def score_and_information(theta):
+        C = np.exp(theta[p_id, C_col])
+        wp = 1 / (1 + np.exp(-theta[p_id, wp_col]))
+        vp, vr = C * wp, C * (1 - wp)
+        p, dp_dvp, dp_dvr = _probability_and_jacobian(SOA, vp, vr)
+        p = np.clip(p, 1e-12, 1 - 1e-12)
+        J = np.zeros((len(SOA), K)) # dp / dtheta of each row
+        J[rows, C_col] = dp_dvp * vp + dp_dvr * vr
+        J[rows, wp_col] = (dp_dvp - dp_dvr) * C * wp * (1 - wp)
+        residual = (k - n * p) / (p * (1 - p))
+        weight = n / (p * (1 - p))
+        score = np.stack([np.bincount(p_id, J[:, i] * residual, num_participants) for i in range(K)], axis=-1)
+        information = np.stack([np.stack([np.bincount(p_id, J[:, i] * J[:, j] * weight, num_participants)
+                                          for j in range(K)], axis=-1) for i in range(K)], axis=-2)
+        return score - (theta - prior_mean) @ prior_precision, information + prior_precision
+
+    for _ in range(iterations):
+        score, information = score_and_information(theta)
+        step = np.clip(np.linalg.solve(information, score[:, :, None])[:, :, 0], -1, 1) # Damped far from the optimum
+        theta = theta + step
+        if np.abs(step).max() < tol:
+            break
+    _, information = score_and_information(theta)
+    return theta, np.linalg.inv(information)
+
+
+def mle_draws(arrays, num_C, num_wp, draws=2000, rng=None):
+    '''Normal draws of the participant parameters around their estimates, and the variables of
+    hierarchical_model_noncentered computed from them.
+
+    :returns: A dict of draws (1 x draws x ...), as for arviz.from_dict
+    '''
+    rng = np.random.default_rng(rng)
+    theta, covariance = fit_participants(arrays, num_C, num_wp)
+    num_participants = len(theta)
+    z = rng.standard_normal((draws, num_participants, theta.shape[1]))
+    theta_draws = theta + np.einsum('pij,dpj->dpi', np.linalg.cholesky(covariance), z)
+    C = np.clip(np.exp(theta_draws[:, :, :num_C]), 0.0001, 0.9999)
+    wp = np.clip(1 / (1 + np.exp(-theta_draws[:, :, num_C:])), 0.0001, 0.9999)
+
+    mask = np.asarray(arrays['participant_mask']) > 0
+    num_real = mask.sum()
+
+    # Group level: the mean and SD of the participants, with the sampling error of the mean
+    posterior = {}
+    for name, x in (('C', C), ('wp', wp)):
+        sd = x[:, mask].std(axis=1, ddof=1) if num_real > 1 else np.zeros((draws, x.shape[2]))
+        posterior[name + '_mu'] = x[:, mask].mean(axis=1) + sd / np.sqrt(num_real) * rng.standard_normal(sd.shape)
+        posterior[name + '_sd'] = sd
+    posterior.update(_derived_variables(C, wp, mask, num_wp))
+    return {name: values[None] for name, values in posterior.items()}
+
+
+def _derived_variables(C, wp, mask, num_wp):
+    '''The deterministic variables of hierarchical_model_noncentered from draws of C and wp 
+    (draws x participants x conditions), with the participants in mask (a boolean array).'''
+    def p_mean(x):
+        return x[:, mask].mean(axis=1)
+
+    vp = wp * C # A single C serves both conditions
+    vr = (1 - wp) * C
+    variables = {'C': C, 'wp': wp, 'vp': vp, 'vr': vr, 'vp_mean': p_mean(vp), 'vr_mean': p_mean(vr)}
+    if num_wp > 1:
+        variables.update({'va_diff_mean': p_mean(vp[:, :, 1] - vr[:, :, 1]),
+                          'vp_diff_mean': p_mean(vp[:, :, 1] - vp[:, :, 0]),
+                          'vr_diff_mean': p_mean(vr[:, :, 1] - vr[:, :, 0]),
+                          'wpa_mean': p_mean(wp[:, :, 1]),
+                          'wp_diff_mean': p_mean(wp[:, :, 1] - wp[:, :, 0])})
+    else:
+        variables['wp_mean'] = p_mean(wp[:, :, 0])
+    return variables
@@ -0,0 +1,70 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Posterior-predictive power: Instead of fixed hyperparameters in the design, every iteration
+simulates its participants from one posterior draw of the hyperparameters of a pilot fit (e.g.,
+the trace returned by fit). The power estimate then reflects the uncertainty about the effect
+left by the pilot study. The hyperparameter draws and all participant parameters are sampled
+for all iterations in one batch at the start of a run, so the iterations only simulate the TOJs.
+'''
+
+import sys
+import logging
+
+from numpy import random, asarray, clip, broadcast_to
+
+logger = logging.getLogger(__name__)
+
+HYPERPARAMETERS = ('C_mu', 'C_sd', 'wp_mu', 'wp_sd')
+
+
+def posterior_draws(trace, name):
+    '''Returns the posterior draws of the variable name as an array with the draws along the
+    first axis. trace can be a pymc3 MultiTrace, an arviz InferenceData, or a dict of arrays.'''
+    try:
+        if hasattr(trace, 'posterior'):
+            values = trace.posterior[name].values # chains x draws x ...
+            return values.reshape((-1,) + values.shape[2:])
+        return asarray(trace[name])
+    except KeyError:
+        logger.error('The pilot trace has no variable %s. It has to come from a fit of hierarchical_model_noncentered.' % name)
+        sys.exit('Aborting')
+
+
+def posterior_setups(trace, setup, iterations, rng=None):
+    '''Draws the participant parameters of all iterations from the posterior of a pilot fit.
+
+    Every iteration uses one posterior draw of C_mu, C_sd, wp_mu, and wp_sd (one entry per condition,
+    or a single one if the pilot model used single_C/single_wp), from which the C and wp of its
+    participants are drawn, clipped as in hierarchical_model_noncentered.
+
+    :param trace: The trace of the pilot fit
+    :param setup: A design dict with at least num_participants, SOAs, and repetitions (hyperparameters are ignored)
+    :param iterations: Number of iterations to draw for
+    :param rng: A seed or numpy Generator
+
+    :returns: One design dict per iteration, in which C_sub and wp_sub (participants x conditions)
+              hold the participant parameters and pilot_draw the index of the posterior draw
+    '''
+    rng = random.default_rng(rng)
+    hyper = {}
+    for name in HYPERPARAMETERS:
+        values = posterior_draws(trace, name)
+        hyper[name] = values.reshape(len(values), -1) # draws x (1 or 2) conditions
+    draw = rng.integers(len(hyper['C_mu']), size=iterations)
+    num_participants = setup['num_participants']
+    num_conditions = hyper['wp_mu'].shape[1]
+
+    def participants(name):
+        mu = hyper[name + '_mu'][draw][:, None, :]
+        sd = hyper[name + '_sd'][draw][:, None, :]
+        values = mu + sd * rng.standard_normal((iterations, num_participants, mu.shape[2]))
+        return clip(values, 0.0001, 0.9999)
+
+    C_sub = broadcast_to(participants('C'), (iterations, num_participants, num_conditions)) # A single C serves both conditions
+    wp_sub = participants('wp')
+    logger.info('[PILOT] Drew %d iterations of %d participants from %d posterior draws of the pilot fit.'
+                % (iterations, num_participants, len(hyper['C_mu'])))
+    return [dict(setup, C_sub=C_sub[i], wp_sub=wp_sub[i], pilot_draw=int(draw[i])) for i in range(iterations)]
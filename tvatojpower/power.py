@@ -0,0 +1,77 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+HDIs of power estimates. Only NumPy and SciPy are needed here, so that results can be merged and
+summarized (e.g., by tvatojpower merge) on machines without PyMC3 and Theano.
+'''
+
+from functools import lru_cache
+
+from numpy import array, asarray, zeros, full, sqrt, where, stack, ndim, broadcast_arrays
+from scipy.optimize import fmin
+from scipy.stats import beta
+
+
+# This function is borrowed from @aloctavodia, who ported it from John Kruschke's scripts
+# https://github.com/aloctavodia/Doing_bayesian_data_analysis/blob/master/HDIofICDF.py
+def HDIofICDF(dist_name, credMass=0.95, **args):
+    # freeze distribution with given arguments
+    distri = dist_name(**args)
+    # initial guess for HDIlowTailPr
+    incredMass =  1.0 - credMass
+
+    def intervalWidth(lowTailPr):
+        return distri.ppf(credMass + lowTailPr) - distri.ppf(lowTailPr)
+
+    # find lowTailPr that minimizes intervalWidth (the width is flat near its minimum, so with
+    # fmin's default xtol of 1e-4, the bounds could be off by ~1e-5)
+    HDIlowTailPr = fmin(intervalWidth, incredMass, ftol=1e-8, xtol=1e-10, disp=False)[0]
+    # return interval as array([low, high])
+    return distri.ppf([HDIlowTailPr, credMass + HDIlowTailPr])
+
+
+# HDI of the beta posterior of a success rate (flat prior), i.e., of Beta(1 + successes, 1 + failures).
+# The lower tail probability of the narrowest interval is found by a golden-section search, 
+# which is vectorized over arrays of counts. Results for single integer counts are memoized,
+# as the same counts come up again and again while power estimates are updated.
+def power_hdi(num_success, attempts, cred_mass=0.95):
+    '''HDI of the power estimate for num_success successes in attempts simulated experiments.
+
+    :param num_success: Number(s) of successes (scalar or array)
+    :param attempts: Number(s) of attempts (scalar or array, broadcast against num_success)
+    :param cred_mass: Mass of the interval
+
+    :returns: Array with the lower and upper bounds in its last dimension
+    '''
+    if ndim(num_success) == 0 and ndim(attempts) == 0 and float(num_success).is_integer() and float(attempts).is_integer():
+        return array(_power_hdi_cached(int(num_success), int(attempts), cred_mass))
+    num_success = asarray(num_success, dtype=float)
+    a = 1.0 + num_success
+    b = 1.0 + asarray(attempts, dtype=float) - num_success
+    a, b = broadcast_arrays(a, b)
+
+    def width(low_tail):
+        return beta.ppf(low_tail + cred_mass, a, b) - beta.ppf(low_tail, a, b)
+
+    golden = (sqrt(5.0) - 1.0) / 2.0
+    lower = zeros(a.shape)
+    upper = full(a.shape, 1.0 - cred_mass)
+    x1 = upper - golden * (upper - lower)
+    x2 = lower + golden * (upper - lower)
+    w1, w2 = width(x1), width(x2)
+    for _ in range(60): # Shrinks the bracket to ~1e-13 of its size
+        left = w1 < w2 # Is the minimum in [lower, x2] (or else in [x1, upper])?
+        upper = where(left, x2, upper)
+        lower = where(left, lower, x1)
+        x1, x2 = (where(left, upper - golden * (upper - lower), x2),
+                  where(left, x1, lower + golden * (upper - lower)))
+        new_width = width(where(left, x1, x2)) # Only one new point per step
+        w1, w2 = where(left, new_width, w2), where(left, w1, new_width)
+    low_tail = (lower + upper) / 2
+    return stack([beta.ppf(low_tail, a, b), beta.ppf(low_tail + cred_mass, a, b)], axis=-1)
+
+@lru_cache(maxsize=None)
+def _power_hdi_cached(num_success, attempts, cred_mass):
+    return tuple(power_hdi(array([num_success]), array([attempts]), cred_mass)[0])
@@ -0,0 +1,206 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Columnar storage of the logged summaries of power runs and sweeps. Instead of appending text rows
+to a CSV file in every iteration, the rows are collected in memory and written in chunks (one file
+per chunk of iterations) into a results directory. The table has a fixed, typed schema: the design
+cell and the iteration (integers), the success, the logged variable, the running power estimate,
+and the summary columns (floats). With pyarrow, the chunks are Parquet files, which can be read
+with filters on the cells, iterations, and variables, without loading the rest; without it, they are
+NumPy .npz files. Output files ending in .csv are written as CSV, as before.
+'''
+
+import json
+import os
+import sys
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SCHEMA_VERSION = 1
+RESULT_COLUMNS = ['cell', 'iteration', 'success', 'variable',
+                  'power_est', 'power_hdi_2.5%', 'power_hdi_97.5%']
+SUMMARY_COLUMNS = ['mean', 'sd', 'hdi_2.5%', 'hdi_97.5%', 'mcse_mean', 'mcse_sd', 'ess_bulk', 'ess_tail', 'r_hat']
+DTYPES = dict({'cell': 'int32', 'iteration': 'int32', 'success': 'int8', 'variable': 'U'},
+              **{column: 'float64' for column in RESULT_COLUMNS[4:] + SUMMARY_COLUMNS})
+
+# The columns of the outputs of sim_and_fit (kind 'run') and sweep (kind 'sweep'), in their order
+KIND_COLUMNS = {'run': ['iteration', 'success', 'power_est', 'power_hdi_2.5%', 'power_hdi_97.5%'],
+                'sweep': ['cell', 'iteration', 'success']}
+
+
+def _is_csv(path):
+    return path.endswith('.csv')
+
+
+class CSVResults:
+    '''Writes the summaries of the iterations to a CSV file, as sim_and_fit always did.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def append(self, out_df):
+        out_df.to_csv(self.path, mode='w' if self.header else 'a', header=self.header)
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class ResultsStore:
+    '''Writes the summaries of the iterations to a results directory in chunks (see above).
+    Opening a store removes the chunks of an earlier run in the directory.
+
+    :param path: The results directory
+    :param kind: 'run' (sim_and_fit) or 'sweep'
+    :param chunk_size: Number of appended summaries per chunk file
+    :param file_format: 'parquet' or 'npz' (default: 'parquet' if pyarrow is installed)
+    '''
+
+    def __init__(self, path, kind='run', chunk_size=100, file_format=None):
+        self.path = path
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.file_format = file_format or ('parquet' if pyarrow is not None else 'npz')
+        if self.file_format == 'parquet' and pyarrow is None:
+            logger.error('Parquet results need pyarrow (e.g., pip install pyarrow).')
+            sys.exit('Aborting')
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith('chunk-'):
+                os.remove(os.path.join(path, name))
+        self.summary_columns = SUMMARY_COLUMNS
+        self._write_schema()
+        self.buffer = []
+        self.buffered = 0
+        self.chunks = 0
+
+    def _write_schema(self):
+        # The summary columns are those of the first chunk; the chunks have all of SUMMARY_COLUMNS
+        with open(os.path.join(self.path, 'schema.json'), 'w') as f:
+            json.dump({'version': SCHEMA_VERSION, 'kind': self.kind, 'format': self.file_format,
+                       'columns': RESULT_COLUMNS + SUMMARY_COLUMNS, 'summary_columns': self.summary_columns}, f)
+
+    def append(self, out_df):
+        '''Adds the summary of an iteration (as written to CSV files: one row per variable).'''
+        self.buffer.append(out_df)
+        self.buffered += 1
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''Writes the buffered summaries as one chunk.'''
+        if not self.buffer:
+            return
+        out_df = pd.concat(self.buffer)
+        if self.chunks == 0:
+            self.summary_columns = [column for column in SUMMARY_COLUMNS if column in out_df]
+            self._write_schema()
+        columns = _typed_columns(out_df)
+        name = os.path.join(self.path, 'chunk-%06d.%s' % (self.chunks, self.file_format))
+        if self.file_format == 'parquet':
+            table = pyarrow.table({column: values for column, values in columns.items()})
+            pyarrow.parquet.write_table(table.cast(_arrow_schema()), name)
+        else:
+            np.savez(name, **columns)
+        self.chunks += 1
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+
+# The columns of summary frames as arrays of the schema's types (missing columns are NaN or -1)
+def _typed_columns(out_df):
+    columns = {}
+    for column in RESULT_COLUMNS + SUMMARY_COLUMNS:
+        if column == 'variable':
+            values = np.asarray(out_df.index, dtype=str)
+        elif column in out_df:
+            values = out_df[column].to_numpy()
+        else:
+            values = np.full(len(out_df), -1 if DTYPES[column].startswith('int') else np.nan)
+        columns[column] = values.astype(DTYPES[column])
+    return columns
+
+
+def _arrow_schema():
+    types = {'int32': pyarrow.int32(), 'int8': pyarrow.int8(), 'U': pyarrow.string(), 'float64': pyarrow.float64()}
+    return pyarrow.schema([(column, types[DTYPES[column]]) for column in RESULT_COLUMNS + SUMMARY_COLUMNS])
+
+
+def open_results(path, kind='run', **store_kwargs):
+    '''Opens the output of a run or sweep for writing: a CSV file if path ends in .csv, a results
+    directory (see ResultsStore) otherwise.'''
+    return CSVResults(path) if _is_csv(path) else ResultsStore(path, kind, **store_kwargs)
+
+
+def read_results(path, cells=None, iterations=None, variables=None):
+    '''Reads the output of a run or sweep (a CSV file or a results directory).
+
+    :param cells: Only read these design cells (of a sweep)
+    :param iterations: Only read these iterations (numbered as in the output, starting at 1)
+    :param variables: Only read the rows of these variables (e.g., 'wp_mu', which includes
+                      'wp_mu[0]' and 'wp_mu[1]')
+
+    :returns: The summaries of the iterations, as in the CSV output (one row per variable)
+    :rtype: pandas.DataFrame
+    '''
+    if _is_csv(path):
+        out_df = pd.read_csv(path, index_col=0, float_precision='round_trip') # As written, to the last bit
+    else:
+        out_df = _read_store(path, cells, iterations)
+    keep = np.ones(len(out_df), dtype=bool)
+    if cells is not None:
+        keep &= out_df['cell'].isin(cells).to_numpy()
+    if iterations is not None:
+        keep &= out_df['iteration'].isin(iterations).to_numpy()
+    if variables is not None:
+        keep &= np.asarray(out_df.index.str.split('[').str[0].isin(variables))
+    return out_df[keep]
+
+
+# The rows of a results directory as a frame (with the columns of its kind); the Parquet chunks
+# are only read for the given cells and iterations
+def _read_store(path, cells, iterations):
+    with open(os.path.join(path, 'schema.json')) as f:
+        schema = json.load(f)
+    files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.startswith('chunk-'))
+    if schema['format'] == 'parquet':
+        if pyarrow is None:
+            logger.error('Reading Parquet results needs pyarrow (e.g., pip install pyarrow).')
+            sys.exit('Aborting')
+        expression = None
+        for column, values in (('cell', cells), ('iteration', iterations)):
+            if values is not None:
+                condition = pyarrow.dataset.field(column).isin(list(values))
+                expression = condition if expression is None else expression & condition
+        dataset = pyarrow.dataset.dataset(files, schema=_arrow_schema(), format='parquet')
+        table = dataset.to_table(filter=expression).to_pandas()
+    else:
+        chunks = [np.load(name) for name in files]
+        table = pd.DataFrame({column: np.concatenate([chunk[column] for chunk in chunks]) if chunks
+                              else np.zeros(0, dtype=DTYPES[column]) for column in RESULT_COLUMNS + SUMMARY_COLUMNS})
+    out_df = table[KIND_COLUMNS[schema['kind']] + schema['summary_columns']]
+    out_df.index = pd.Index(table['variable'].astype(str).to_numpy())
+    return out_df
+
+
+def export_csv(path, csv_path, **filters):
+    '''Writes (part of, see read_results) a results directory as a CSV file, as written by runs
+    with a .csv output file.'''
+    read_results(path, **filters).to_csv(csv_path)
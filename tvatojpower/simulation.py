@@ -0,0 +1,148 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+The TVATOJ psychometric function and the simulation of TOJ experiments. Only NumPy is needed
+here (pandas only for the dataframes returned by simulate_tojs), so that simulations do not pay
+for importing PyMC3 and Theano.
+'''
+
+import sys
+import logging
+
+from numpy import (random, exp, array, asarray, log, clip, arange, stack, where, broadcast_to,
+                   result_type, add, errstate, nan_to_num)
+
+from .tojdata import TOJCounts
+
+logger = logging.getLogger(__name__)
+
+
+# The TVAOJ psychometric function, see Tünnermann, Petersen, & Scharlau (2015):
+def tvatoj_psychometric_function(SOA, C=None, wp=None, vp=None, vr=None, dtype=None):
+    """ Takes SOAs in ms and either C in 1/ms and w or vp and vr in 1/ms.
+
+    All arguments are broadcast against each other, so a whole posterior can be evaluated
+    in one call, e.g., C and wp of shape (draws, participants, 1) with SOAs of shape (num_SOAs,)
+    yield (draws, participants, num_SOAs) probabilities of a "probe first" judgment.
+    In each element, only the leading stimulus' exp(-v*|SOA|) is computed, as both branches 
+    share it. dtype (e.g., 'float32') sets the precision of the computation and the result.
+    """
+    if vp is None or vr is None:
+        C = asarray(C, dtype=dtype)
+        wp = asarray(wp, dtype=dtype)
+        vp = C * wp
+        vr = C * (1 - wp)
+    SOA, vp, vr = (asarray(x, dtype=dtype) for x in (SOA, vp, vr))
+    probe_leads = SOA <= 0
+    p = where(probe_leads, vp, vr).astype(result_type(SOA, vp, vr, 1.0), copy=False) # Leading rate
+    p *= -abs(SOA)
+    exp(p, out=p)  # The leading stimulus has not arrived when the trailing one appears, ...
+    p /= vp + vr   # ... then the race is won by the probe with probability vp/(vp+vr)
+    p *= where(probe_leads, -vr, vp)
+    add(p, 1, out=p, where=probe_leads)
+    return p
+
+# A generative simulation of the process (rng: a seed, a Generator, or None)
+def simulate_subject_toj(SOA, reps, C, wp, rng=None):
+    rng = random.default_rng(rng)
+    v1 = C * wp                             # attentional weights and overall rate C ...
+    v2 = C * (1 -wp)                        # ... determine the individual rates
+    probe_first_count = 0                   # Our counter each SOA starts with zero
+    for i in range(0, reps):                # For every repetition
+        tS = -log(1 - rng.random()) / v2    # let stimulus 2 race and record its VSTM arrival
+        tC = SOA - log(1 - rng.random()) / v1 # same for stimulus 1, offset by the SOA
+        if tC < tS:                         # Did 1 arrive before 2?
+            probe_first_count += 1          # Count as a "probe first judment"
+    return probe_first_count                # Return the result across all SOAs
+
+
+# The same process as simulate_subject_toj, but batched: Since the race of the two
+# exponential processes yields a "probe first" judgment with the probability given by
+# the psychometric function, the counts are binomial and can be drawn all at once.
+# SOA, reps, C, and wp are broadcast against each other.
+def simulate_toj_counts(SOA, reps, C, wp, rng=None):
+    rng = random.default_rng(rng)
+    with errstate(divide='ignore', invalid='ignore'):
+        p = tvatoj_psychometric_function(SOA, C, wp)
+    p = clip(nan_to_num(p, nan=0.0), 0, 1) # Zero rates (C clipped to 0) never win the race
+    return rng.binomial(reps, p)
+
+
+# Draws the individual parameters of the participants of a simulation setup from their
+# distributions (or takes those given as C_sub and wp_sub). Drawn Cs are clipped at 0, drawn wps to
+# [0, 1], the range in which the race (and hence both simulations) is defined. Returns C and wp as arrays
+# of participants x conditions (condition 0 is neutral, 1 is attention; one condition for single wp setups).
+def participant_parameters(simulation_setup, rng=None):
+
+    s = simulation_setup # For convenient access ...
+    rng = random.default_rng(rng) # Accepts a seed, a Generator, or None (fresh entropy)
+    single_wp=False
+
+    # Get the paras per individual
+    if 'C_sub' in s: # Given participant parameters (participants x conditions), e.g., from posterior_setups
+        C_sub = asarray(s['C_sub'])
+        wp_sub = asarray(s['wp_sub'])
+    elif 'C_sd_within' in s: # within subject design
+        logging.info('[SIM] Simulating two different (but correlated) C parameters.')
+        C_sub_mu = clip(rng.normal(s['C_mu'], s['C_sd_between'], size=s['num_participants']), 0, None)
+        C_a_sub =  clip(rng.normal(C_sub_mu, s['C_sd_within'], size=s['num_participants']), 0, None)
+        C_n_sub =  clip(rng.normal(C_sub_mu, s['C_sd_within'], size=s['num_participants']), 0,None)
+        wp_a_sub =  clip(rng.normal(s['wp_a_mu'], s['wp_a_sd_between'], size=s['num_participants']), 0, 1)
+        wp_n_sub =  clip(rng.normal(s['wp_n_mu'], s['wp_n_sd_between'], size=s['num_participants']), 0, 1)
+    elif 'C_a_mu' in s: # between design
+        logging.info('[SIM] Simulating two independent C parameters.')
+        C_a_sub =  clip(rng.normal(s['C_a_mu'], s['C_a_sd_between'], size=s['num_participants']), 0, None)
+        C_n_sub =  clip(rng.normal(s['C_n_mu'], s['C_n_sd_between'], size=s['num_participants']), 0,None)
+        wp_a_sub =  clip(rng.normal(s['wp_a_mu'], s['wp_a_sd_between'], size=s['num_participants']), 0, 1)
+        wp_n_sub =  clip(rng.normal(s['wp_n_mu'], s['wp_n_sd_between'], size=s['num_participants']), 0, 1)
+    elif 'C_single_mu' in s:
+        logging.info('[SIM] Simulating a single C parameter for both conditions.')
+        C_a_sub =  clip(rng.normal(s['C_single_mu'], s['C_single_sd_between'], size=s['num_participants']), 0, None)
+        C_n_sub = C_a_sub
+        wp_a_sub =  clip(rng.normal(s['wp_a_mu'], s['wp_a_sd_between'], size=s['num_participants']), 0, 1)
+        wp_n_sub =  clip(rng.normal(s['wp_n_mu'], s['wp_n_sd_between'], size=s['num_participants']), 0, 1)
+    elif 'wp_mu' in s: # A single wp ==> Single condition experient
+        logging.info('[SIM] Simulating a single condition.')
+        C_sub =  clip(rng.normal(s['C_mu'], s['C_sd_between'], size=s['num_participants']), 0, None)
+        wp_sub =  clip(rng.normal(s['wp_mu'], s['wp_sd_between'], size=s['num_participants']), 0, 1)
+        single_wp=True
+    else:
+        logger.error('Could not infer the design from the simulation parameters provided. Please refer to the exmaples')
+        sys.exit('Aborting')
+
+    # Individual parameters as participants x conditions (condition 0 is neutral, 1 is attention)
+    if single_wp:
+        C_sub = C_sub[:, None]
+        wp_sub = wp_sub[:, None]
+    elif 'C_sub' not in s:
+        C_sub = stack([C_n_sub, C_a_sub], axis=1)
+        wp_sub = stack([wp_n_sub, wp_a_sub], axis=1)
+
+    return C_sub, wp_sub
+
+
+# Simulate TOJs for a group of participants, by drawing 
+# their individual parameters from distributions. Returns a TOJ dataframe,
+# or (with as_counts=True) the same data as TOJCounts arrays.
+def simulate_tojs(simulation_setup, rng=None, as_counts=False): 
+
+    s = simulation_setup
+    rng = random.default_rng(rng)
+    C_sub, wp_sub = participant_parameters(s, rng)
+
+    # Get the TOJs for all participants x SOAs x conditions in one go
+    SOAs = array(s['SOAs'], dtype=float)
+    reps = array(s['repetitions'])
+    shape = (C_sub.shape[0], len(SOAs), C_sub.shape[1])
+    probe_first_count = simulate_toj_counts(SOAs[None, :, None], reps[None, :, None],
+                                            C_sub[:, None, :], wp_sub[:, None, :], rng)
+
+    counts = TOJCounts(participant_id=broadcast_to(arange(shape[0])[:, None, None], shape).ravel(),
+                       condition_id=broadcast_to(arange(shape[2])[None, None, :], shape).ravel(),
+                       SOA=broadcast_to(SOAs[None, :, None], shape).ravel(),
+                       repetitions=broadcast_to(reps[None, :, None], shape).ravel(),
+                       probe_first_count=probe_first_count.ravel())
+
+    return counts if as_counts else counts.to_frame()
@@ -0,0 +1,162 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+A surrogate of the power of designs, learned from finished simulations. It is a Bayesian logistic
+regression of the success of an iteration on features of its design (by default, the log number of
+participants, the log number of trials per participant and condition, the effect size, and the effect
+size times the square root of all trials, on which power depends most directly), with a
+normal (Laplace) approximation of the posterior of the weights. Once fitted to the outcomes of earlier
+runs (one surrogate per research goal), it predicts the power of new designs in milliseconds, with
+intervals that reflect how well the earlier runs constrain the prediction, and points out which
+designs are still too uncertain and need real simulations.
+'''
+
+import sys
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from .results import read_results
+
+logger = logging.getLogger(__name__)
+
+
+def _effect(design):
+    '''The effect size of a design: the difference of the attention and neutral condition wp
+    (or C, for designs without wp effect), in the group means of the design.'''
+    if 'wp_a_mu' in design and 'wp_n_mu' in design:
+        return design['wp_a_mu'] - design['wp_n_mu']
+    if 'C_a_mu' in design and 'C_n_mu' in design:
+        return design['C_a_mu'] - design['C_n_mu']
+    return 0.0
+
+DEFAULT_FEATURES = {
+    'log_participants': lambda design: np.log(design['num_participants']),
+    'log_trials': lambda design: np.log(np.sum(design['repetitions'])),
+    'effect': _effect,
+    'effect_x_sqrt_trials': lambda design: _effect(design) * np.sqrt(design['num_participants'] * np.sum(design['repetitions'])),
+}
+
+
+class PowerSurrogate:
+    '''Predicts the power of designs from the outcomes of earlier simulations.
+
+    :param features: A dict mapping feature names to functions of a design dict (default: DEFAULT_FEATURES).
+                     The features are standardized before fitting.
+    :param prior_sd: Prior SD of the weights of the (standardized) features
+    '''
+
+    def __init__(self, features=None, prior_sd=2.5):
+        self.features = DEFAULT_FEATURES if features is None else features
+        self.prior_sd = prior_sd
+        self.rows = []      # One (features, successes, attempts) per added design
+        self.weights = None
+
+    def add(self, design, successes, attempts):
+        '''Adds the outcomes of the iterations of a design.'''
+        if attempts > 0: # Designs without iterations carry no information
+            self.rows.append(([float(f(design)) for f in self.features.values()], successes, attempts))
+            self.weights = None
+
+    def add_run(self, design, outfile):
+        '''Adds the iterations logged by a sim_and_fit run with design to outfile (a CSV file or results directory).'''
+        success = read_results(outfile).groupby('iteration')['success'].first()
+        self.add(design, int(success.sum()), len(success))
+
+    def add_sweep(self, base_design, power_curve):
+        '''Adds all cells of a power-curve table returned by sweep with base_design.'''
+        result_columns = ['iterations', 'successes', 'power', 'power_hdi_2.5%', 'power_hdi_97.5%', 'stopped']
+        cell_columns = [column for column in power_curve.columns if column not in result_columns]
+        for _, row in power_curve.iterrows():
+            design = dict(base_design)
+            design.update({column: row[column] for column in cell_columns})
+            self.add(design, int(row['successes']), int(row['iterations']))
+
+    def _design_matrix(self, designs):
+        X = np.array([[f(design) for f in self.features.values()] for design in designs], dtype=float)
+        return np.column_stack([np.ones(len(X)), (X - self.center) / self.scale])
+
+    def fit(self):
+        '''Fits the weights to the added outcomes (MAP by Newton's method, with the inverse Hessian
+        as posterior covariance).'''
+        if not self.rows:
+            logger.error('The surrogate needs the outcomes of at least one design.')
+            sys.exit('Aborting')
+        X = np.array([row[0] for row in self.rows], dtype=float)
+        k = np.array([row[1] for row in self.rows], dtype=float)
+        n = np.array([row[2] for row in self.rows], dtype=float)
+        self.center = X.mean(axis=0)
+        self.scale = np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0) # Constant features are only centered
+        X = np.column_stack([np.ones(len(X)), (X - self.center) / self.scale])
+        prior_precision = np.diag([1 / 10.0**2] + [1 / self.prior_sd**2] * (X.shape[1] - 1))
+
+        w = np.zeros(X.shape[1])
+        for _ in range(100):
+            p = 1 / (1 + np.exp(-X @ w))
+            gradient = X.T @ (k - n * p) - prior_precision @ w
+            hessian = (X * (n * p * (1 - p))[:, None]).T @ X + prior_precision
+            step = np.linalg.solve(hessian, gradient)
+            w += step
+            if np.abs(step).max() < 1e-10:
+                break
+        p = 1 / (1 + np.exp(-X @ w))
+        self.weights = w
+        self.covariance = np.linalg.inv((X * (n * p * (1 - p))[:, None]).T @ X + prior_precision)
+        logger.info('[SURROGATE] Fitted to %d iterations of %d designs.' % (n.sum(), len(n)))
+        return self
+
+    def _linear_predictor(self, designs):
+        if self.weights is None:
+            self.fit()
+        X = self._design_matrix(designs)
+        return X @ self.weights, np.sqrt(np.einsum('ij,jk,ik->i', X, self.covariance, X))
+
+    def predict(self, designs):
+        '''Predicts the power of designs (a list of design dicts).
+
+        :returns: A table with one row per design: the power estimate (posterior mean) and its 95 % interval
+        :rtype: pandas.DataFrame
+        '''
+        mean, sd = self._linear_predictor(designs)
+        z = norm.ppf(0.975)
+        return pd.DataFrame({'power': 1 / (1 + np.exp(-mean / np.sqrt(1 + np.pi * sd**2 / 8))), # Probit approximation
+                             'power_2.5%': 1 / (1 + np.exp(-(mean - z * sd))),
+                             'power_97.5%': 1 / (1 + np.exp(-(mean + z * sd)))})
+
+    def needs_mcmc(self, designs, target_power=0.8, max_width=None):
+        '''Predicts the power of designs and marks those that need real simulations: designs whose
+        95 % interval contains target_power (or is wider than max_width, if given).
+
+        :returns: The table of predict with an additional column needs_mcmc
+        :rtype: pandas.DataFrame
+        '''
+        table = self.predict(designs)
+        undecided = (table['power_2.5%'] < target_power) & (table['power_97.5%'] > target_power)
+        if max_width is not None:
+            undecided |= table['power_97.5%'] - table['power_2.5%'] > max_width
+        table['needs_mcmc'] = undecided
+        return table
+
+    def loo_pit(self, draws=4000, rng=None):
+        '''Checks the calibration of the surrogate: Each design is left out in turn, and its number of
+        successes is compared with the predictive distribution of the others' surrogate. Returns the
+        probability integral transforms, which are roughly uniform on [0, 1] if the surrogate is calibrated
+        (many values near 0 or 1 indicate overconfidence).'''
+        if len(self.rows) < 2:
+            logger.error('The calibration check needs the outcomes of at least two designs.')
+            sys.exit('Aborting')
+        rng = np.random.default_rng(rng)
+        pit = []
+        for i, (features, successes, attempts) in enumerate(self.rows):
+            others = PowerSurrogate(self.features, self.prior_sd)
+            others.rows = self.rows[:i] + self.rows[i+1:]
+            others.fit()
+            x = np.concatenate([[1.0], (np.array(features) - others.center) / others.scale])
+            w = rng.multivariate_normal(others.weights, others.covariance, size=draws)
+            k = rng.binomial(attempts, 1 / (1 + np.exp(-w @ x)))
+            pit.append(np.mean(k < successes) + 0.5 * np.mean(k == successes))
+        return np.array(pit)
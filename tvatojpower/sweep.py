@@ -0,0 +1,188 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+Power curves across many designs (e.g., numbers of participants, SOA layouts, or effect sizes).
+All cells of a design grid share one model (built for the largest cell), and iterations are
+scheduled in rounds: Cells whose power HDI clearly lies above or below the target power stop,
+while the others receive further iterations. Within a round, cheap cells (few trials) go first.
+'''
+
+from itertools import product
+import logging
+import warnings
+
+import pandas as pd
+from numpy import random
+from tqdm import tqdm
+
+from .pilot import posterior_setups
+from .results import open_results
+from .power import power_hdi
+from .tvatojpower import (simulate_tojs, get_model, _fit_iteration, _reusable_nuts,
+                          _iteration_seed_sequence, _worker_pool, _worker_iteration, _stopping_reason,
+                          _warm_start_if, _colored_logging)
+
+logger = logging.getLogger(__name__)
+
+
+def design_grid(base_design, grid):
+    '''Expands a grid over design keys into the designs of all its cells.
+
+    :param base_design: A design dict as used by sim_and_fit, which supplies all keys that are not varied
+    :param grid: A dict mapping design keys to lists of values. Keys that have to be varied together
+                 can be given as a tuple, e.g., {('SOAs', 'repetitions'): [(SOAs_1, reps_1), (SOAs_2, reps_2)]}
+
+    :returns: List of (cell, design) tuples, where cell is a dict of the varied keys and their values
+    '''
+    keys = list(grid)
+    cells = []
+    for values in product(*(grid[key] for key in keys)):
+        cell = {}
+        for key, value in zip(keys, values):
+            if isinstance(key, tuple):
+                cell.update(zip(key, value))
+            else:
+                cell[key] = value
+        design = dict(base_design)
+        design.update(cell)
+        cells.append((cell, design))
+    return cells
+
+
+def sweep(base_design, grid, model_func, condition_func, target_power=0.8,
+          goal_var_names=None, log_var_names=['C_mu', 'wp_mu'],
+          single_C=False, single_wp=False,
+          iterations_per_round=10, min_iterations=10, max_iterations=200, stop_hdi_width=None,
+          outfile=None,
+          turn_off_warnings=True,
+          tune=1000,
+          target_accept=0.85,
+          init='adapt_diag',
+          chains=4,
+          cores=4,
+          processes=None,
+          seed=None,
+          backend='nuts',
+          backend_kwargs=None,
+          metrics_callback=None,
+          pilot_trace=None,
+          warm_start=False,
+          warm_start_tune=1000):
+    '''Estimates the power of all designs in a grid (see design_grid) in one scheduled job.
+
+    :param target_power: Cells stop once their power HDI lies entirely above or below this value
+    :param iterations_per_round: Number of iterations each unfinished cell receives per round
+    :param min_iterations: Number of iterations per cell before the stopping rules are applied
+    :param max_iterations: Maximum number of iterations per cell
+    :param stop_hdi_width: Cells also stop once their power HDI is narrower than this
+    :param outfile: If given, the logged summary of every iteration is written to this CSV file (if the
+                    name ends in .csv) or results directory (see sim_and_fit)
+    :param metrics_callback: A function that is called with the metrics record (a dict, see
+                             sim_and_fit) of every iteration, which includes its cell
+    :param pilot_trace: The trace of a pilot fit, from whose posterior the participants of all
+                        iterations are drawn (see sim_and_fit)
+    :param warm_start: Start the NUTS adaptation of all iterations from a warm-up run on the largest
+                       cell (see sim_and_fit), so that a much smaller tune suffices
+    :param warm_start_tune: Number of tuning steps of the warm-up run
+
+    All further parameters are as in sim_and_fit.
+
+    :returns: A power-curve table with one row per cell: the varied design values, the number of
+              iterations and successes, the power estimate and its 95 % HDI, and why the cell stopped
+    :rtype: pandas.DataFrame
+    '''
+    _colored_logging()
+    if (turn_off_warnings):
+        warnings.filterwarnings("ignore")
+        logging.warning('Attention: Warnings turned off. ')
+
+    cells = design_grid(base_design, grid)
+    entropy = random.SeedSequence(seed).entropy
+    logger.info('[SEED] Master seed of this sweep: %d' % entropy)
+    setups = [[design] * max_iterations for _, design in cells]
+    if pilot_trace is not None: # One batch per cell, from streams that no iteration uses
+        setups = [posterior_setups(pilot_trace, design, max_iterations, rng=random.SeedSequence(entropy, spawn_key=(c,)))
+                  for c, (_, design) in enumerate(cells)]
+    layouts = [simulate_tojs(setups[c][0], rng=0, as_counts=True) for c in range(len(cells))] # Only used for the shapes
+    num_trials = [layout['repetitions'].sum() for layout in layouts]
+    order = sorted(range(len(cells)), key=lambda c: num_trials[c])  # Cheap cells first
+
+    # One model for all cells, large enough for the largest one
+    model_kwargs = dict(single_C=single_C, single_wp=single_wp,
+                        max_participants=max(design['num_participants'] for _, design in cells),
+                        max_rows=max(len(layout) for layout in layouts))
+    model = get_model(model_func, layouts[order[-1]], **model_kwargs)
+    if backend == 'nuts':
+        _reusable_nuts(model, init, chains, target_accept)
+    logger.info('[SWEEP] %d design cells, model built for %d participants and %d data rows.'
+                % (len(cells), model_kwargs['max_participants'], model_kwargs['max_rows']))
+
+    fit_kwargs = dict(condition_func=condition_func, goal_var_names=goal_var_names,
+                      log_var_names=log_var_names, tune=tune, target_accept=target_accept,
+                      init=init, chains=chains, cores=cores,
+                      backend=backend, backend_kwargs=backend_kwargs)
+    fit_kwargs['warm_start'] = _warm_start_if(warm_start, backend, True, model, setups[order[-1]][0], entropy,
+                                              warm_start_tune, chains, cores, target_accept)
+    pool = None
+    if processes is not None:
+        pool = _worker_pool(processes, model_func, layouts[order[-1]], model_kwargs, fit_kwargs)
+
+    successes = [0] * len(cells)
+    attempts = [0] * len(cells)
+    stopped = [None] * len(cells)
+    output = None if outfile is None else open_results(outfile, 'sweep')
+    try:
+        round_num = 0
+        while any(reason is None for reason in stopped):
+            round_num += 1
+            tasks = []
+            for c in order:
+                if stopped[c] is None:
+                    num_new = min(iterations_per_round, max_iterations - attempts[c])
+                    tasks += [((c, i), _iteration_seed_sequence(entropy, c, i), setups[c][i])
+                              for i in range(attempts[c], attempts[c] + num_new)]
+            if pool is None:
+                results = ((key, *_fit_iteration(model, design, seed_seq, **fit_kwargs))
+                           for key, seed_seq, design in tasks)
+            else:
+                results = pool.imap(_worker_iteration, tasks)
+
+            for (c, i), success, summary_stats, out_df, metrics in tqdm(results, total=len(tasks),
+                                                                        desc='Sweep round %d' % round_num):
+                successes[c] += success
+                attempts[c] += 1
+                if metrics_callback is not None:
+                    metrics_callback(dict(metrics, cell=c, iteration=i + 1))
+                if output is not None:
+                    out_df.insert(0, 'cell', c)
+                    out_df.insert(1, 'iteration', i + 1)
+                    out_df.insert(2, 'success', success)
+                    output.append(out_df)
+
+            for c in order:
+                if stopped[c] is not None:
+                    continue
+                hdi = power_hdi(successes[c], attempts[c])
+                stopped[c] = _stopping_reason(hdi, attempts[c], min_iterations, stop_hdi_width, target_power)
+                if stopped[c] is None and attempts[c] >= max_iterations:
+                    stopped[c] = 'the maximum number of iterations was reached'
+                logger.info('[ESTIMATE] Cell %d %s: %.2f [95 %% HDI: %.2f to %.2f] after %d iterations%s'
+                            % (c, cells[c][0], successes[c] / attempts[c], hdi[0], hdi[1], attempts[c],
+                               '' if stopped[c] is None else ' (done, %s)' % stopped[c]))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if output is not None:
+            output.close()
+
+    hdis = power_hdi(successes, attempts)
+    table = pd.DataFrame([cell for cell, _ in cells])
+    table['iterations'] = attempts
+    table['successes'] = successes
+    table['power'] = table['successes'] / table['iterations']
+    table['power_hdi_2.5%'] = hdis[:, 0]
+    table['power_hdi_97.5%'] = hdis[:, 1]
+    table['stopped'] = stopped
+    return table
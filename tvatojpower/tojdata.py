@@ -0,0 +1,121 @@
+# Copyright (c) 2020 Jan Tünnermann. All rights reserved.
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+'''
+TOJ data as sufficient statistics. For the TVATOJ model, all judgments of a participant in
+one condition at one SOA are exchangeable, so the data reduce to one (repetitions, probe first
+count) pair per (participant, condition, SOA) cell. Trial-level data (one row per judgment) and
+count-level data (possibly with repeated cells, e.g., from several sessions) are collapsed into
+these cells with integer keys and bincount, without constructing any DataFrame rows. The models
+are built on the cells, so their size does not grow with the number of trials.
+'''
+
+import sys
+import logging
+
+from numpy import asarray, arange, zeros, ones, unique, bincount
+
+logger = logging.getLogger(__name__)
+
+
+class TOJCounts:
+    '''TOJ counts per (participant, condition, SOA) cell, stored as parallel arrays. Columns can
+    be accessed like those of a DataFrame, e.g., counts['SOA'].
+
+    :param participant_id: Participant indices, 0 to num_participants - 1
+    :param condition_id: Condition indices (0 is neutral, 1 is attention)
+    :param SOA: SOAs in ms (negative: the probe leads)
+    :param repetitions: Number of judgments per cell
+    :param probe_first_count: Number of "probe first" judgments per cell
+    :param participant_labels: The original participant identifiers (default: the indices)
+    '''
+
+    COLUMNS = ('participant_id', 'condition_id', 'SOA', 'repetitions', 'probe_first_count')
+
+    def __init__(self, participant_id, condition_id, SOA, repetitions, probe_first_count,
+                 participant_labels=None):
+        self.participant_id = asarray(participant_id, dtype='int64')
+        self.condition_id = asarray(condition_id, dtype='int64')
+        self.SOA = asarray(SOA, dtype='float64')
+        self.repetitions = asarray(repetitions, dtype='int64')
+        self.probe_first_count = asarray(probe_first_count, dtype='int64')
+        if participant_labels is None:
+            num_participants = int(self.participant_id.max()) + 1 if len(self.participant_id) else 0
+            participant_labels = arange(num_participants)
+        self.participant_labels = asarray(participant_labels)
+
+    @property
+    def num_participants(self):
+        return len(self.participant_labels)
+
+    def __len__(self):
+        return len(self.participant_id)
+
+    def __contains__(self, column):
+        return column in self.COLUMNS
+
+    def __getitem__(self, column):
+        if column not in self.COLUMNS:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def to_frame(self):
+        '''Returns the counts as a TOJ DataFrame (one row per cell, as returned by simulate_tojs).'''
+        import pandas as pd
+        return pd.DataFrame({column: self[column] for column in self.COLUMNS})
+
+    @classmethod
+    def from_counts(cls, participant_id, condition_id, SOA, repetitions, probe_first_count):
+        '''Collapses count-level data into cells. Rows of the same cell are summed up; data without
+        such duplicates keep their row order. Participant identifiers can be arbitrary labels.'''
+        participant_labels, p_id = unique(asarray(participant_id), return_inverse=True)
+        p_id = p_id.ravel()
+        c_id = asarray(condition_id, dtype='int64')
+        SOA = asarray(SOA, dtype='float64')
+        repetitions = asarray(repetitions, dtype='int64')
+        probe_first_count = asarray(probe_first_count, dtype='int64')
+        if len(p_id) == 0:
+            return cls(p_id, c_id, SOA, repetitions, probe_first_count, participant_labels)
+
+        # One integer key per cell (participant-major, then condition, then SOA)
+        SOA_values, SOA_id = unique(SOA, return_inverse=True)
+        num_conditions = int(c_id.max()) + 1
+        cell = (p_id * num_conditions + c_id) * len(SOA_values) + SOA_id.ravel()
+        cells, row = unique(cell, return_inverse=True)
+        if len(cells) == len(cell):
+            return cls(p_id, c_id, SOA, repetitions, probe_first_count, participant_labels)
+
+        row = row.ravel()
+        p_c, SOA_id = divmod(cells, len(SOA_values))
+        p_id, c_id = divmod(p_c, num_conditions)
+        return cls(p_id, c_id, SOA_values[SOA_id],
+                   bincount(row, weights=repetitions, minlength=len(cells)).round(),
+                   bincount(row, weights=probe_first_count, minlength=len(cells)).round(),
+                   participant_labels)
+
+    @classmethod
+    def from_trials(cls, participant_id, condition_id, SOA, probe_first):
+        '''Collapses trial-level data (one judgment per entry; probe_first is 1 or True if the
+        probe was judged first) into cells.'''
+        probe_first = asarray(probe_first)
+        return cls.from_counts(participant_id, condition_id, SOA,
+                               ones(len(probe_first), dtype='int64'), probe_first.astype('int64'))
+
+
+def toj_counts(data):
+    '''Returns the cells of TOJ data, which can be TOJCounts, or a DataFrame (or dict of arrays)
+    with either count-level columns (participant_id, condition_id, SOA, repetitions,
+    probe_first_count) or trial-level columns (participant_id, condition_id, SOA, probe_first).
+    A missing condition_id is read as a single condition.'''
+    if isinstance(data, TOJCounts):
+        return data
+    condition_id = data['condition_id'] if 'condition_id' in data else zeros(len(data['SOA']), dtype='int64')
+    if 'repetitions' in data and 'probe_first_count' in data:
+        return TOJCounts.from_counts(data['participant_id'], condition_id, data['SOA'],
+                                     data['repetitions'], data['probe_first_count'])
+    if 'probe_first' in data:
+        return TOJCounts.from_trials(data['participant_id'], condition_id, data['SOA'], data['probe_first'])
+    logger.error('TOJ data need either the columns repetitions and probe_first_count (counts) '
+                 'or the column probe_first (one row per judgment).')
+    sys.exit('Aborting')
@@ -20,214 +20,670 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from numpy import random, exp, array, zeros, log, clip
-from theano.tensor import mean, cast
+from numpy import random, array, asarray, zeros, ones, arange, stack, prod, mean, concatenate
+from numpy.linalg import pinv
+from theano.tensor import cast, switch
 from theano.tensor import exp as ttexp
-from math import floor
-from numpy.random import random as runif
-from tqdm import tqdm
 import pymc3
+import arviz as az
+from pymc3.util import get_default_varnames
+from pymc3.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+from pymc3.step_methods.step_sizes import DualAverageAdaptation
 import pandas as pd
-from scipy.optimize import fmin
-from scipy.stats import *
 from tqdm import tqdm
-from scipy.stats import beta
-import sys, logging
+import sys, os, logging
+import multiprocessing
 import warnings
 
+from .checkpoint import Checkpoint
+from .likelihood import toj_binomial_logp_tensor
+from .tojdata import toj_counts
+from .simulation import simulate_tojs
+from .power import power_hdi
+# Re-exported, as these used to be defined here (see simulation.py and power.py)
+from .simulation import tvatoj_psychometric_function, simulate_subject_toj, simulate_toj_counts
+from .power import HDIofICDF
+from .pilot import posterior_setups
+from .mle import mle_draws
+from .compiled import compiled_nuts, MODEL_VARS
+from .metrics import timed, SamplingMonitor, sampling_metrics, METRICS_COLUMNS
+from .results import open_results
+
 logger = logging.getLogger(__name__)
-try: 
-    import coloredlogs
-    coloredlogs.install(level='DEBUG')
-except ImportError:
-    logging.info('If you like the terminal output colored.' + 
-                 'Install colored coloredlogs (e.g., pip install coloredlogs)')
-
-# The TVAOJ psychometric function, see Tünnermann, Petersen, & Scharlau (2015):
-def tvatoj_psychometric_function(SOA, C, wp, vp=None, vr=None):
-    """ Takes SOAs in ms and either C in 1/ms and w or vp and vr in 1/ms """
-    if vp is None or vr is None:
-        vp = C * wp
-        vr = C * (1 - wp)
-    SOA = array(SOA)
-    left = (1-exp(-vp*abs(SOA))) + exp(-vp*abs(SOA)) * vp/(vp+vr)
-    right = exp(-vr*abs(SOA))*vp/(vp+vr)
-    return ((SOA<=0)*left  + (SOA>0)*right)
-
-# A generative simulation of the process
-def simulate_subject_toj(SOA, reps, C, wp):
-    v1 = C * wp                             # attentional weights and overall rate C ...
-    v2 = C * (1 -wp)                        # ... determine the individual rates
-    probe_first_count = 0                   # Our counter each SOA starts with zero
-    for i in range(0, reps):                # For every repetition
-        tS = -log(1 - runif(1)) / v2        # let stimulus 2 race and record its VSTM arrival
-        tC =  SOA - log(1 - runif(1)) / v1  # sane for stimulus 1, offset by the SOA
-        if tC < tS:                         # Did 1 arrive before 2?
-            probe_first_count += 1          # Count as a "probe first judment"
-    return probe_first_count                # Return the result across all SOAs
-
-
-# Simulate TOJs for a group of participants, by drawing 
-# their individual parameters from distributions
-def simulate_tojs(simulation_setup): 
-
-    s = simulation_setup # For convenient access ...
-    single_wp=False
-
-    # Get the paras per individual
-    if 'C_sd_within' in s: # within subject design
-        logging.info('[SIM] Simulating two different (but correlated) C parameters.')
-        C_sub_mu = clip(random.normal(s['C_mu'], s['C_sd_between'], size=s['num_participants']), 0, None)
-        C_a_sub =  clip(random.normal(C_sub_mu, s['C_sd_within'], size=s['num_participants']), 0, None)
-        C_n_sub =  clip(random.normal(C_sub_mu, s['C_sd_within'], size=s['num_participants']), 0,None)
-        wp_a_sub =  clip(random.normal(s['wp_a_mu'], s['wp_a_sd_between'], size=s['num_participants']), 0, None)
-        wp_n_sub =  clip(random.normal(s['wp_n_mu'], s['wp_n_sd_between'], size=s['num_participants']), 0, None)
-    elif 'C_a_mu' in s: # between design
-        logging.info('[SIM] Simulating two independent C parameters.')
-        C_a_sub =  clip(random.normal(s['C_a_mu'], s['C_a_sd_between'], size=s['num_participants']), 0, None)
-        C_n_sub =  clip(random.normal(s['C_n_mu'], s['C_n_sd_between'], size=s['num_participants']), 0,None)
-        wp_a_sub =  clip(random.normal(s['wp_a_mu'], s['wp_a_sd_between'], size=s['num_participants']), 0, None)
-        wp_n_sub =  clip(random.normal(s['wp_n_mu'], s['wp_n_sd_between'], size=s['num_participants']), 0, None)
-    elif 'C_single_mu' in s:
-        logging.info('[SIM] Simulating a single C parameter for both conditions.')
-        C_a_sub =  clip(random.normal(s['C_single_mu'], s['C_single_sd_between'], size=s['num_participants']), 0, None)
-        C_n_sub = C_a_sub
-        wp_a_sub =  clip(random.normal(s['wp_a_mu'], s['wp_a_sd_between'], size=s['num_participants']), 0, None)
-        wp_n_sub =  clip(random.normal(s['wp_n_mu'], s['wp_n_sd_between'], size=s['num_participants']), 0, None)
-    elif 'wp_mu' in s: # A single wp ==> Single condition experient
-        logging.info('[SIM] Simulating a single condition.')
-        C_sub =  clip(random.normal(s['C_mu'], s['C_sd_between'], size=s['num_participants']), 0, None)
-        wp_sub =  clip(random.normal(s['wp_mu'], s['wp_sd_between'], size=s['num_participants']), 0, None)
-        single_wp=True
-    else:
-        logger.error('Could not infer the design from the simulation parameters provided. Please refer to the exmaples')
+
+
+# Colored terminal output for the long-running functions (installed on their first call, not on import)
+_colored_logging_installed = False
+
+def _colored_logging():
+    global _colored_logging_installed
+    if _colored_logging_installed:
+        return
+    _colored_logging_installed = True
+    try: 
+        import coloredlogs
+        coloredlogs.install(level='DEBUG')
+    except ImportError:
+        logging.info('If you like the terminal output colored.' + 
+                     'Install colored coloredlogs (e.g., pip install coloredlogs)')
+
+
+# The design-dependent arrays the model is built on. Padding to a maximum number of 
+# participants and rows keeps the shapes of the model fixed, so that one (compiled) model
+# can be reused for different designs via pymc3.set_data. Padded rows have zero repetitions
+# (and hence do not contribute to the likelihood), padded participants are masked out of the 
+# group-level summaries. The data are collapsed into one row per (participant, condition, SOA),
+# so trial-level data can be passed as well (see tojdata.py).
+def model_data(data, num_participants=None, num_rows=None):
+    data = toj_counts(data)
+    actual_participants = data.num_participants
+    actual_rows = len(data)
+    num_participants = actual_participants if num_participants is None else num_participants
+    num_rows = actual_rows if num_rows is None else num_rows
+    if actual_participants > num_participants or actual_rows > num_rows:
+        logger.error('The data (%d participants, %d rows) do not fit into a model built for %d participants and %d rows.'
+                     % (actual_participants, actual_rows, num_participants, num_rows))
         sys.exit('Aborting')
 
+    def pad(values, dtype):
+        padded = zeros(num_rows, dtype=dtype)
+        padded[:actual_rows] = values
+        return padded
 
-    # Get the TOJs
-    participant_id = []
-    condition_id = []
-    probe_first_count = []
-    repetitions = []
-    SOA = []
+    participant_mask = zeros(num_participants)
+    participant_mask[:actual_participants] = 1.0
+    return {'participant_id': pad(data['participant_id'], 'int64'),
+            'condition_id': pad(data['condition_id'], 'int64'),
+            'SOA': pad(data['SOA'], 'float64'),
+            'repetitions': pad(data['repetitions'], 'int64'),
+            'probe_first_count': pad(data['probe_first_count'], 'int64'),
+            'participant_mask': participant_mask}
 
-    if single_wp:
-        condition_nums = [0]
-    else:
-        condition_nums = [0, 1]
-
-    for p in range(0, s['num_participants']):
-        for i,soa in enumerate(s['SOAs']):
-            for c in condition_nums:
-                participant_id.append(p)
-                condition_id.append(c)
-                SOA.append(soa)
-                repetitions.append(s['repetitions'][i])
-                if c == 0 and not single_wp: # simulate a neutral condition TOJ
-                    probe_first_count.append(simulate_subject_toj(soa, s['repetitions'][i], C_n_sub[p], wp_n_sub[p]))
-                if c == 1 and not single_wp: # simulate an attention condition TOJ
-                    probe_first_count.append(simulate_subject_toj(soa, s['repetitions'][i], C_a_sub[p], wp_a_sub[p]))
-                if c == 0 and single_wp:
-                    probe_first_count.append(simulate_subject_toj(soa, s['repetitions'][i], C_sub[p], wp_sub[p]))
-
-    df = pd.DataFrame()
-    df['participant_id'] = participant_id
-    df['condition_id'] = condition_id
-    df['SOA'] = SOA
-    df['repetitions'] = repetitions
-    df['probe_first_count'] = probe_first_count
-                
-        
-    return df
+
+# The model data of a batch of K datasets (see hierarchical_model_noncentered), padded to a common
+# number of participants and rows and stacked along a leading dimension of length K.
+def stacked_model_data(datasets, num_participants=None, num_rows=None):
+    datasets = [toj_counts(data) for data in datasets]
+    num_participants = max(data.num_participants for data in datasets) if num_participants is None else num_participants
+    num_rows = max(len(data) for data in datasets) if num_rows is None else num_rows
+    arrays = [model_data(data, num_participants, num_rows) for data in datasets]
+    return {name: stack([a[name] for a in arrays]) for name in arrays[0]}
 
 
+# The number of datasets of a batched model (None for a model of a single dataset)
+def _num_datasets(model):
+    mask = model.named_vars.get('participant_mask')
+    return None if mask is None or mask.get_value().ndim == 1 else len(mask.get_value())
+
+
+# Symbolic version of tvatoj_psychometric_function for SOAs stored in a shared pymc3.Data container
+def _tvatoj_psychometric_function_symbolic(SOA, C, wp):
+    vp = C * wp
+    vr = C * (1 - wp)
+    probe_leads = SOA <= 0
+    shared = ttexp(-switch(probe_leads, vp, vr) * abs(SOA)) / (vp + vr)
+    return switch(probe_leads, 1 - shared * vr, shared * vp)
+
 
 # Using the non-centered reparamtrization to reduce divergenses
 # See here for the rationale: https://twiecki.io/blog/2017/02/08/bayesian-hierchical-non-centered/
-def hierarchical_model_noncentered(data, single_C=False, single_wp=False):
+def hierarchical_model_noncentered(data, single_C=False, single_wp=False,
+                                   max_participants=None, max_rows=None, likelihood='fused'):
     '''Sets up a pymc3 model based on TVATOJ.
 
-    :param data: A TOJ dataframe as return by the simulations
+    :param data: TOJ data, e.g., a TOJ dataframe as returned by the simulations or trial-level data (see toj_counts).
+                 A list of K datasets yields a batched model of K independent experiments (each with
+                 its own hyperparameters), whose variables all have a leading dimension of length K.
     :param single_C: Whether to use single C (for both conditions)
     :param single_wp: Whether to use a single wp (implies single C and produces a model for a single condition only)
+    :param max_participants: Build the model for up to this many participants (default: as many as in data)
+    :param max_rows: Build the model for up to this many data rows (default: as many as in data)
+    :param likelihood: 'fused' uses a single log-likelihood op with an analytic gradient (faster with many data rows),
+                       'binomial' an observed pymc3.Binomial (e.g., for posterior predictive sampling)
 
     :returns: Model
     :rtype: pymc3.Model
     '''
+    if likelihood not in ('fused', 'binomial'):
+        raise ValueError("Unknown likelihood %r. Please use 'fused' or 'binomial'." % (likelihood,))
  
     model = pymc3.Model()
     with model: 
 
-        p_id = data['participant_id']
-        c_id = data['condition_id']
-
-        if single_wp:        
-            wp_c_id = len(data['condition_id']) * [0]
+        if single_wp:
             single_C = True
-        else:
-            wp_c_id = c_id
 
-        if single_C:        
-            C_c_id = len(data['condition_id']) * [0]
+        # All design-dependent arrays are shared containers and can be exchanged with pymc3.set_data.
+        # In a batched model, they are K x rows (K x participants) and the rows of all datasets are 
+        # flattened into one vector, with the dataset as an additional index into the parameters.
+        batched = isinstance(data, list)
+        if batched:
+            arrays = stacked_model_data(data, max_participants, max_rows)
+            batch_shape = (len(data),)
         else:
-            C_c_id = c_id
-
-            
-        pfc =  pymc3.Data('probe_first_count',data['probe_first_count'])
-
-        C_mu = pymc3.Normal('C_mu', 0.080, 0.050, shape=len(set(C_c_id)))
-        C_sd = pymc3.HalfCauchy('C_sd', 0.1, shape=len(set(C_c_id)))
+            arrays = model_data(data, max_participants, max_rows)
+            batch_shape = ()
+        def rows(x):
+            return x.flatten() if batched else x
+        p_id = rows(cast(pymc3.Data('participant_id', arrays['participant_id']), 'int64'))
+        c_id = rows(cast(pymc3.Data('condition_id', arrays['condition_id']), 'int64'))
+        SOA_data = pymc3.Data('SOA', arrays['SOA'])
+        SOA = rows(SOA_data)
+        repetitions = rows(cast(pymc3.Data('repetitions', arrays['repetitions']), 'int64'))
+        pfc =  rows(pymc3.Data('probe_first_count', arrays['probe_first_count']))
+        p_mask = pymc3.Data('participant_mask', arrays['participant_mask'])
+
+        wp_c_id = 0 * c_id if single_wp else c_id
+        C_c_id = 0 * c_id if single_C else c_id
+        num_participants = arrays['participant_mask'].shape[-1]
+        num_C = 1 if single_C else 2
+        num_wp = 1 if single_wp else 2
+
+        C_mu = pymc3.Normal('C_mu', 0.080, 0.050, shape=batch_shape + (num_C,))
+        C_sd = pymc3.HalfCauchy('C_sd', 0.1, shape=batch_shape + (num_C,))
         
-        wp_mu = pymc3.Normal('wp_mu', 0.5,0.2, shape=len(set(wp_c_id)))
-        wp_sd = pymc3.HalfCauchy('wp_sd', 0.2, shape=len(set(wp_c_id)))
-
-        wp_e = pymc3.Normal('wp_e', 0,1, shape=(len(set(p_id)), len(set(wp_c_id))))
-        C_e = pymc3.Normal('C_e', 0,1, shape=(len(set(p_id)), len(set(C_c_id))))
-
-        C = pymc3.Deterministic('C', (C_mu + C_e * C_sd).clip(0.0001, 0.9999))
-        wp = pymc3.Deterministic('wp',  (wp_mu + wp_e * wp_sd).clip(0.0001, 0.9999))
-    
-        theta = pymc3.Deterministic('theta', tvatoj_psychometric_function(
-            data['SOA'], C[(p_id, C_c_id)], wp[(p_id, wp_c_id)]))
-
-        y = pymc3.Binomial('y', n=cast(data['repetitions'], 'int64'),
-                                p=theta, observed=pfc,
-                                dtype='int64')  
+        wp_mu = pymc3.Normal('wp_mu', 0.5,0.2, shape=batch_shape + (num_wp,))
+        wp_sd = pymc3.HalfCauchy('wp_sd', 0.2, shape=batch_shape + (num_wp,))
+
+        wp_e = pymc3.Normal('wp_e', 0,1, shape=batch_shape + (num_participants, num_wp))
+        C_e = pymc3.Normal('C_e', 0,1, shape=batch_shape + (num_participants, num_C))
+
+        if batched: # The group-level parameters of each dataset broadcast over its participants
+            C = pymc3.Deterministic('C', (C_mu.dimshuffle(0, 'x', 1) + C_e * C_sd.dimshuffle(0, 'x', 1)).clip(0.0001, 0.9999))
+            wp = pymc3.Deterministic('wp',  (wp_mu.dimshuffle(0, 'x', 1) + wp_e * wp_sd.dimshuffle(0, 'x', 1)).clip(0.0001, 0.9999))
+            d_id = arange(batch_shape[0]).repeat(arrays['SOA'].shape[1]) # The dataset of each (flattened) row
+            C_rows = C[(d_id, p_id, C_c_id)]
+            wp_rows = wp[(d_id, p_id, wp_c_id)]
+        else:
+            C = pymc3.Deterministic('C', (C_mu + C_e * C_sd).clip(0.0001, 0.9999))
+            wp = pymc3.Deterministic('wp',  (wp_mu + wp_e * wp_sd).clip(0.0001, 0.9999))
+            C_rows = C[(p_id, C_c_id)]
+            wp_rows = wp[(p_id, wp_c_id)]
+        theta_rows = _tvatoj_psychometric_function_symbolic(SOA, C_rows, wp_rows)
+        theta = pymc3.Deterministic('theta', theta_rows.reshape(SOA_data.shape) if batched else theta_rows)
+
+        if likelihood == 'fused':
+            y = pymc3.Potential('y', toj_binomial_logp_tensor(C_rows * wp_rows, C_rows * (1 - wp_rows),
+                                                              SOA, repetitions, cast(pfc, 'int64')))
+        else:
+            y = pymc3.Binomial('y', n=repetitions,
+                                    p=theta_rows, observed=pfc,
+                                    dtype='int64')  
 
         # The deterministic transformation could probably be externalized
         # However, here the calculation is most safe to produce proper within-subject estimates
         vp = pymc3.Deterministic('vp', wp * C)
         vr = pymc3.Deterministic('vr', (1 - wp) * C)
         
+        # Means across the participants (padded participants are masked out)
+        def p_mean(x):
+            mask = p_mask if x.ndim == p_mask.ndim else p_mask.dimshuffle(*range(p_mask.ndim), 'x')
+            return (x * mask).sum(axis=p_mask.ndim - 1) / mask.sum(axis=p_mask.ndim - 1)
+
+        # The parameters of one condition of all participants
+        def cond(x, condition):
+            return x[:, :, condition] if batched else x[:, condition]
         
-        vp_mean = pymc3.Deterministic('vp_mean', mean(vp, axis=0)) 
-        vr_mean = pymc3.Deterministic('vr_mean', mean(vr, axis=0)) 
+        vp_mean = pymc3.Deterministic('vp_mean', p_mean(vp)) 
+        vr_mean = pymc3.Deterministic('vr_mean', p_mean(vr)) 
         if not single_wp:
-            va_diff_mean = pymc3.Deterministic('va_diff_mean', mean(vp[:,1] - vr[:,1])) # Diff of probe and ref rate in the attention cond
-            vp_diff_mean = pymc3.Deterministic('vp_diff_mean', mean(vp[:,1] - vp[:,0])) # Diff of attention and neutral condition probe rates
-            vr_diff_mean = pymc3.Deterministic('vr_diff_mean', mean(vr[:,1] - vr[:,0])) # Diff of attention and neutral condition probe rates
-            wpa_mean = pymc3.Deterministic('wpa_mean', mean(wp[:,1])) 
-            wp_diff_mean = pymc3.Deterministic('wp_diff_mean', mean(wp[:,1] - wp[:,0])) 
+            va_diff_mean = pymc3.Deterministic('va_diff_mean', p_mean(cond(vp, 1) - cond(vr, 1))) # Diff of probe and ref rate in the attention cond
+            vp_diff_mean = pymc3.Deterministic('vp_diff_mean', p_mean(cond(vp, 1) - cond(vp, 0))) # Diff of attention and neutral condition probe rates
+            vr_diff_mean = pymc3.Deterministic('vr_diff_mean', p_mean(cond(vr, 1) - cond(vr, 0))) # Diff of attention and neutral condition probe rates
+            wpa_mean = pymc3.Deterministic('wpa_mean', p_mean(cond(wp, 1))) 
+            wp_diff_mean = pymc3.Deterministic('wp_diff_mean', p_mean(cond(wp, 1) - cond(wp, 0))) 
         else:
-            wp_vs_point5_mean = pymc3.Deterministic('wp_mean', mean(wp)) 
+            wp_vs_point5_mean = pymc3.Deterministic('wp_mean', p_mean(cond(wp, 0))) 
         return(model)
 
- 
-# This function is borrowed from @aloctavodia, who ported it from John Kruschke's scripts
-# https://github.com/aloctavodia/Doing_bayesian_data_analysis/blob/master/HDIofICDF.py
-def HDIofICDF(dist_name, credMass=0.95, **args):
-    # freeze distribution with given arguments
-    distri = dist_name(**args)
-    # initial guess for HDIlowTailPr
-    incredMass =  1.0 - credMass
-
-    def intervalWidth(lowTailPr):
-        return distri.ppf(credMass + lowTailPr) - distri.ppf(lowTailPr)
-
-    # find lowTailPr that minimizes intervalWidth
-    HDIlowTailPr = fmin(intervalWidth, incredMass, ftol=1e-8, disp=False)[0]
-    # return interval as array([low, high])
-    return distri.ppf([HDIlowTailPr, credMass + HDIlowTailPr])
+
+# Models (and their NUTS step methods with the compiled logp and gradient functions) are cached
+# by their structure. Designs differing only in the number of participants or SOAs can share
+# one model if it is built for the largest of them (see max_participants/max_rows). Without
+# these, a model is built for the layout of its data, which is then part of the structure.
+_model_cache = {}
+_nuts_steps = {}
+
+# The layout of data (or of the largest of a list of datasets): the numbers of participants,
+# data rows, and conditions
+def _data_layout(data):
+    datasets = [toj_counts(d) for d in (data if isinstance(data, list) else [data])]
+    return (max(d.num_participants for d in datasets), max(len(d) for d in datasets),
+            max(int(d['condition_id'].max()) + 1 if len(d) else 0 for d in datasets))
+
+def get_model(model_func, data, single_C=False, single_wp=False,
+              max_participants=None, max_rows=None):
+    '''Returns a cached model of the given structure, with its data containers set to data.
+
+    :param model_func: A function that returns a pymc3 model, e.g., hierarchical_model_noncentered
+    :param data: TOJ data, or a list of K datasets for a batched model (see hierarchical_model_noncentered)
+    :param max_participants: Maximum number of participants the (shared) model should support
+    :param max_rows: Maximum number of data rows the (shared) model should support
+
+    :returns: Model
+    :rtype: pymc3.Model
+    '''
+    key = (model_func, single_C, single_wp, max_participants, max_rows,
+           len(data) if isinstance(data, list) else None,
+           _data_layout(data) if max_participants is None or max_rows is None else None)
+    if key not in _model_cache:
+        shape_kwargs = {}
+        if max_participants is not None or max_rows is not None: # custom model_funcs might not support padding
+            shape_kwargs = dict(max_participants=max_participants, max_rows=max_rows)
+        _model_cache[key] = model_func(data, single_C=single_C, single_wp=single_wp, **shape_kwargs)
+    model = _model_cache[key]
+    set_model_data(model, data)
+    return model
+
+
+def set_model_data(model, data):
+    '''Exchanges the data (and the design) in the data containers of model. A batched model
+    takes a list of as many datasets as it was built for.'''
+    participant_mask = model.named_vars.get('participant_mask')
+    num_participants = None if participant_mask is None else participant_mask.get_value().shape[-1]
+    num_rows = model.named_vars['probe_first_count'].get_value().shape[-1]
+    num_datasets = _num_datasets(model)
+    if num_datasets is not None and (not isinstance(data, list) or len(data) != num_datasets):
+        logger.error('The batched model needs a list of %d datasets.' % num_datasets)
+        sys.exit('Aborting')
+    if num_datasets is None:
+        arrays = model_data(data, num_participants, num_rows)
+    else:
+        arrays = stacked_model_data(data, num_participants, num_rows)
+    with model:
+        pymc3.set_data({name: values for name, values in arrays.items() if name in model.named_vars})
+
+
+# Returns start points and a NUTS step method for model, where the step method (including its 
+# compiled logp and gradient functions) is reused across calls. Its step size and mass matrix 
+# adaptation are reset by pymc3.sample at the start of each chain. Only the 'adapt_diag' 
+# initialization is reproduced here, other inits are left to pymc3.sample (no reuse).
+# With a warm start (see _warm_start), the adaptation starts from its step size, mass matrix,
+# and start points instead, which pymc3.sample also resets to at the start of each chain.
+def _reusable_nuts(model, init, chains, target_accept, warm_start=None):
+    if init != 'adapt_diag' and warm_start is None:
+        return None, None
+    if warm_start is None:
+        start = [model.test_point] * chains
+        mean_start = array([model.dict_to_array(point) for point in start]).mean(axis=0)
+        potential = QuadPotentialDiagAdapt(model.ndim, mean_start, ones(model.ndim), 10)
+        step_size = 0.25 / model.ndim ** 0.25 # pymc3's default initial step size
+    else:
+        start = warm_start['start']
+        potential = QuadPotentialDiagAdapt(model.ndim, warm_start['mean'], warm_start['mass_diag'], 10)
+        step_size = warm_start['step_size']
+    cached = _nuts_steps.get(id(model))
+    if cached is None or cached[1].target_accept != target_accept:
+        step = pymc3.NUTS(potential=potential, target_accept=target_accept, model=model)
+        _nuts_steps[id(model)] = (model, step) # Holding the model keeps its id unique
+    else:
+        step = cached[1]
+        step.potential = potential
+    step.step_adapt = DualAverageAdaptation(step_size, target_accept, 0.05, 0.75, 10) # pymc3's defaults
+    return start, step
+
+
+# Warm start of NUTS: One run with full tuning, on a dataset of its own (drawn from the master seed),
+# yields a step size, a diagonal mass matrix (the posterior variances in the unconstrained space),
+# and start points (the last draw of each chain). All iterations start their adaptation from this 
+# state, so that a short tuning phase (e.g., tune=100) suffices. As they all start from the same state,
+# the results still do not depend on the number of processes.
+WARM_START_KEY = 2**32 - 1 # Seed key of the warm-up run (iteration keys are indices)
+
+# One dataset, or a list of num_datasets datasets for a batched model
+def _simulate_datasets(setup, rng, num_datasets=None):
+    if num_datasets is None:
+        return simulate_tojs(setup, rng=rng, as_counts=True)
+    return [simulate_tojs(setup, rng=rng, as_counts=True) for _ in range(num_datasets)]
+
+def _warm_start(model, setup, seed_seq, tune, chains, cores, target_accept, progressbar=True):
+    sim_seq, sample_seq = seed_seq.spawn(2)
+    set_model_data(model, _simulate_datasets(setup, random.default_rng(sim_seq), _num_datasets(model)))
+    trace = _sample_posterior(model, 'nuts', tune=tune, chains=chains, cores=cores, init='adapt_diag',
+                              target_accept=target_accept, progressbar=progressbar,
+                              random_seed=_chain_seeds(sample_seq, chains))
+    draws = zeros((len(trace) * trace.nchains, model.ndim))
+    for var_map in model.bijection.ordering.vmap: # The layout of model.dict_to_array
+        draws[:, var_map.slc] = trace.get_values(var_map.var).reshape(len(draws), -1)
+    step_size = mean([stats[-1] for stats in trace.get_sampler_stats('step_size', combine=False)])
+    start = [{var.name: trace.point(-1, chain=chain)[var.name] for var in model.free_RVs}
+             for chain in trace.chains]
+    logger.info('[WARM START] Adapted a step size of %.3f in %d tuning steps.' % (step_size, tune))
+    return {'step_size': step_size, 'mass_diag': draws.var(axis=0), 'mean': draws.mean(axis=0), 'start': start}
+
+
+# Every iteration gets its own random stream, derived from the master seed and the
+# iteration's key (e.g., its index) only. Hence, results do not depend on which process runs an iteration.
+def _iteration_seed_sequence(entropy, *key):
+    return random.SeedSequence(entropy, spawn_key=key)
+
+# The seeds of the chains (pymc3 seeds each chain with one integer) from a seed sequence
+def _chain_seeds(seed_seq, chains):
+    return [int(x) for x in seed_seq.generate_state(chains)]
+
+
+# Inference backends: Full NUTS sampling (the default, or compiled for hierarchical_model_noncentered) 
+# or fast approximations for screening designs. All return draws that pymc3.summary turns into the same 
+# kind of summary frame. If var_names is given, NUTS, the compiled NUTS, and the Laplace and mle
+# approximations only record (and compute) these variables.
+BACKENDS = ('nuts', 'numba', 'advi', 'laplace', 'mle')
+
+def _sample_posterior(model, backend='nuts', draws=2000, tune=1000, chains=4, cores=4, init='adapt_diag',
+                      target_accept=0.85, random_seed=None, progressbar=True, backend_kwargs=None,
+                      callback=None, warm_start=None, var_names=None):
+    backend_kwargs = {} if backend_kwargs is None else backend_kwargs
+    with model:
+        if backend == 'nuts':
+            start, step = _reusable_nuts(model, init, chains, target_accept, warm_start)
+            if step is None: # A reused step has its target acceptance rate already (pymc3 rejects it then)
+                backend_kwargs = dict({'target_accept': target_accept}, **backend_kwargs)
+            if var_names is not None: # pymc3's checks need all variables, so they are left to the summary
+                backend_kwargs = dict({'trace': [model[name] for name in var_names],
+                                       'compute_convergence_checks': False}, **backend_kwargs)
+            return pymc3.sample(draws, tune=tune, chains=chains, cores=cores, init=init,
+                                step=step, start=start, progressbar=progressbar,
+                                random_seed=random_seed, callback=callback, **backend_kwargs)
+        if backend == 'numba':
+            return _compiled_nuts(model, draws, tune, chains, cores, target_accept, random_seed, var_names,
+                                  backend_kwargs)
+        seed = None if random_seed is None else random_seed[0]
+        if backend == 'advi':
+            # Mean-field ADVI, draws are taken from the fitted approximation
+            approx = pymc3.fit(method='advi', random_seed=seed, progressbar=progressbar,
+                               **dict({'n': 30000}, **backend_kwargs))
+            return approx.sample(draws)
+        if backend == 'laplace':
+            return _laplace_approximation(model, draws, seed, progressbar, var_names)
+        if backend == 'mle':
+            return _mle_approximation(model, draws, seed, var_names)
+    logger.error('Unknown inference backend %s. Please use one of %s.' % (backend, ', '.join(BACKENDS)))
+    sys.exit('Aborting')
+
+
+# Normal approximation around the MAP estimate (in the unconstrained space of the free variables) 
+# with the inverse Hessian as covariance. The deterministics are computed for every draw. Note that this 
+# is crude for hierarchical models (the MAP of group SDs can be near zero) and meant for screening only.
+def _laplace_approximation(model, draws, seed, progressbar, var_names=None):
+    rng = random.default_rng(seed)
+    free_vars = model.free_RVs
+    map_point = pymc3.find_MAP(model=model, progressbar=progressbar)
+    precision = pymc3.find_hessian(map_point, vars=free_vars, model=model)
+    mode = concatenate([asarray(map_point[var.name]).ravel() for var in free_vars])
+    flat_draws = rng.multivariate_normal(mode, pinv(precision), size=draws, method='eigh')
+
+    names = get_default_varnames([var.name for var in model.unobserved_RVs], include_transformed=False)
+    names = names if var_names is None else var_names
+    outputs = model.fastfn([model[name] for name in names])
+    posterior = {name: [] for name in names}
+    for flat in flat_draws:
+        point, offset = {}, 0
+        for var in free_vars:
+            shape = asarray(map_point[var.name]).shape
+            size = int(prod(shape))
+            point[var.name] = flat[offset:offset + size].reshape(shape)
+            offset += size
+        for name, value in zip(names, outputs(point)):
+            posterior[name].append(value)
+    return az.from_dict(posterior={name: array(values)[None] for name, values in posterior.items()})
+
+
+# The variables an iteration records: only those that are summarized. Without goal_var_names,
+# the goals are checked on the summary of all variables, except for theta (one per data row).
+# Returns the goal variables and all recorded variables.
+def _recorded_var_names(model, goal_var_names, log_var_names):
+    if goal_var_names is None:
+        names = get_default_varnames([var.name for var in model.unobserved_RVs], include_transformed=False)
+        goal_var_names = [name for name in names if name != 'theta']
+    goal_var_names = list(goal_var_names)
+    return goal_var_names, goal_var_names + [name for name in log_var_names if name not in goal_var_names]
+
+
+# Normal approximations around per-participant maximum likelihood fits instead of the hierarchical 
+# posterior (see mle.py). No MCMC and no compiled functions are involved, so this is the fastest backend.
+# It provides the variables of hierarchical_model_noncentered only.
+def _mle_approximation(model, draws, seed, var_names=None):
+    arrays = {name: model.named_vars[name].get_value() for name in 
+              ('participant_id', 'condition_id', 'SOA', 'repetitions', 'probe_first_count', 'participant_mask')}
+    num_C, num_wp = model.test_point['C_mu'].shape[-1], model.test_point['wp_mu'].shape[-1]
+    if _num_datasets(model) is None:
+        posterior = mle_draws(arrays, num_C, num_wp, draws, seed)
+    else: # The datasets of a batched model are fitted one after the other
+        rng = random.default_rng(seed)
+        batch = [mle_draws({name: values[k] for name, values in arrays.items()}, num_C, num_wp, draws, rng)
+                 for k in range(_num_datasets(model))]
+        posterior = {name: stack([dataset[name] for dataset in batch], axis=2) for name in batch[0]}
+    var_names = list(posterior) if var_names is None else var_names
+    missing = [name for name in var_names if name not in posterior]
+    if missing:
+        logger.error('The mle backend does not estimate %s.' % ', '.join(missing))
+        sys.exit('Aborting')
+    return az.from_dict(posterior={name: posterior[name] for name in var_names})
+
+
+# NUTS compiled for hierarchical_model_noncentered (see compiled.py), with all chains in one process.
+# The model's data containers are read, its Theano functions are not used. The leapfrog steps of the
+# warm-up are kept in the attributes of the sample stats (see sampling_metrics).
+def _compiled_nuts(model, draws, tune, chains, cores, target_accept, random_seed, var_names, backend_kwargs):
+    if any(name not in model.named_vars for name in MODEL_VARS):
+        logger.error('The numba backend only samples hierarchical_model_noncentered.')
+        sys.exit('Aborting')
+    arrays = {name: model.named_vars[name].get_value() for name in 
+              ('participant_id', 'condition_id', 'SOA', 'repetitions', 'probe_first_count', 'participant_mask')}
+    num_C, num_wp = model.test_point['C_mu'].shape[-1], model.test_point['wp_mu'].shape[-1]
+    posterior, sample_stats, tune_steps = compiled_nuts(arrays, num_C, num_wp, draws, tune, chains, cores, target_accept,
+                                                        seeds=random_seed, var_names=var_names, **backend_kwargs)
+    trace = az.from_dict(posterior=posterior, sample_stats=sample_stats)
+    trace.sample_stats.attrs['tune_grad_evals'] = tune_steps
+    return trace
+
+
+# The actual lengths of the padded axes of the variables of model for data (see model_data): the
+# number of participants for the variables with one entry per participant (e.g., C or wp), and 
+# the number of data rows for theta. Empty for models without padding.
+def _actual_lengths(model, data):
+    participant_mask = model.named_vars.get('participant_mask')
+    if participant_mask is None:
+        return {}
+    num_participants, num_rows, _ = _data_layout(data)
+    lengths = {name: num_participants for name in get_default_varnames(model.named_vars, include_transformed=False)
+               if getattr(model[name], 'ndim', None) == participant_mask.ndim + 1}
+    if 'theta' in model.named_vars:
+        lengths['theta'] = num_rows
+    return lengths
+
+
+# Drops the rows of padded participants (and data rows) from a summary, i.e., those whose first 
+# index is beyond the actual length of their variable (see _actual_lengths)
+def _drop_padded(summary, lengths):
+    if not lengths:
+        return summary
+    names = summary.index.str.split('[').str[0]
+    first_index = summary.index.str.split('[').str[1].str.split(',').str[0].str.rstrip(']')
+    return summary[[name not in lengths or int(index) < lengths[name] for name, index in zip(names, first_index)]]
+
+
+# One summary (as pymc3.summary) of the recorded variables, computed from their draws only. 
+# Returns the rows of each list of var_names_lists, in its order, without those of padded 
+# participants if their actual lengths are given (see _actual_lengths).
+def _summarize(trace, var_names, *var_names_lists, lengths=None):
+    if hasattr(trace, 'posterior'):
+        posterior = {name: trace.posterior[name].values for name in var_names}
+    else:
+        posterior = {name: array(trace.get_values(name, combine=False)) for name in var_names} # chains x draws x ...
+    summary = _drop_padded(az.summary(az.from_dict(posterior=posterior), hdi_prob=0.95), lengths)
+    row_var_names = summary.index.str.split('[').str[0]
+    return [pd.concat([summary[row_var_names == name] for name in names]) for names in var_names_lists]
+
+
+# The summaries of the datasets of a batched model, from one summary of all of them: The rows of 
+# dataset k (e.g., 'C_mu[k, 1]' or 'wp_diff_mean[k]') become the rows of a model of a single 
+# dataset ('C_mu[1]' or 'wp_diff_mean'). Returns one list as from _summarize per dataset, 
+# without the rows of padded participants if the actual lengths of each dataset are given.
+def _summarize_batch(trace, var_names, num_datasets, *var_names_lists, lengths=None):
+    summary, = _summarize(trace, var_names, var_names)
+    names = summary.index.str.split('[').str[0]
+    indices = summary.index.str.split('[').str[1].str.rstrip(']').str.split(', ')
+    dataset = indices.str[0].astype(int)
+    summary.index = [name if len(index) == 1 else '%s[%s]' % (name, ', '.join(index[1:]))
+                     for name, index in zip(names, indices)]
+    lengths = [None] * num_datasets if lengths is None else lengths
+    return [[_drop_padded(pd.concat([summary[(dataset == k) & (names == name)] for name in names_list]), lengths[k])
+             for names_list in var_names_lists] for k in range(num_datasets)]
+
+
+# One simulate -> sample -> summarize cycle on an already built model.
+# Returns the success, the goal and log summaries, and a metrics record (see metrics.py).
+def _fit_iteration(model, setup, seed_seq, condition_func, goal_var_names, log_var_names,
+                   tune, target_accept, init, chains, cores, backend='nuts', backend_kwargs=None,
+                   warm_start=None, progressbar=True):
+    metrics = {'backend': backend}
+    monitor = SamplingMonitor() if backend == 'nuts' else None
+    sim_seq, sample_seq = seed_seq.spawn(2) # Independent streams for simulation and sampling
+    goal_names, var_names = _recorded_var_names(model, goal_var_names, log_var_names)
+    with timed(metrics, 'simulate'):
+        data = simulate_tojs(setup, rng=random.default_rng(sim_seq), as_counts=True)
+    with timed(metrics, 'set_data'):
+        set_model_data(model, data)
+    with timed(metrics, 'sample'):
+        trace = _sample_posterior(model, backend, tune=tune, chains=chains, cores=cores, init=init,
+                                  target_accept=target_accept, progressbar=progressbar,
+                                  random_seed=_chain_seeds(sample_seq, chains),
+                                  backend_kwargs=backend_kwargs, callback=monitor, warm_start=warm_start,
+                                  var_names=var_names)
+    with timed(metrics, 'summary'):
+        summary_stats, out_df = _summarize(trace, var_names, goal_names, log_var_names,
+                                           lengths=_actual_lengths(model, data))
+    with timed(metrics, 'condition'):
+        success = condition_func(summary_stats) * 1 # Either 0 or 1, depending on reaching our goals.
+    sampling_metrics(metrics, monitor, trace, summary_stats)
+    return success, summary_stats, out_df, metrics
+
+
+# The same cycle for a batch of iterations on a batched model (see sim_and_fit's batch_size), with 
+# one seed sequence and one setup per dataset. The datasets are simulated from their own streams
+# (as in _fit_iteration) and sampled jointly, with the chain seeds drawn from the stream of the first one.
+# Returns one result as from _fit_iteration per dataset. The times of the joint phases (and the NUTS
+# counters) are shared by the datasets, the times evenly.
+def _fit_batch(model, setups, seed_seqs, condition_func, goal_var_names, log_var_names,
+               tune, target_accept, init, chains, cores, backend='nuts', backend_kwargs=None,
+               warm_start=None, progressbar=True):
+    batch_metrics = {'backend': backend}
+    monitor = SamplingMonitor() if backend == 'nuts' else None
+    streams = [seed_seq.spawn(2) for seed_seq in seed_seqs]
+    goal_names, var_names = _recorded_var_names(model, goal_var_names, log_var_names)
+    simulate_s, datasets = [], []
+    for setup, (sim_seq, _) in zip(setups, streams):
+        metrics = {}
+        with timed(metrics, 'simulate'):
+            datasets.append(simulate_tojs(setup, rng=random.default_rng(sim_seq), as_counts=True))
+        simulate_s.append(metrics['simulate_s'])
+    with timed(batch_metrics, 'set_data'):
+        set_model_data(model, datasets)
+    with timed(batch_metrics, 'sample'):
+        trace = _sample_posterior(model, backend, tune=tune, chains=chains, cores=cores, init=init,
+                                  target_accept=target_accept, progressbar=progressbar,
+                                  random_seed=_chain_seeds(streams[0][1], chains),
+                                  backend_kwargs=backend_kwargs, callback=monitor, warm_start=warm_start,
+                                  var_names=var_names)
+    with timed(batch_metrics, 'summary'):
+        summaries = _summarize_batch(trace, var_names, len(datasets), goal_names, log_var_names,
+                                     lengths=[_actual_lengths(model, data) for data in datasets])
+    shared = {phase: batch_metrics[phase] / len(datasets) for phase in ('set_data_s', 'sample_s', 'summary_s')}
+    results = []
+    for (summary_stats, out_df), dataset_simulate_s in zip(summaries, simulate_s):
+        metrics = dict(batch_metrics, simulate_s=dataset_simulate_s, **shared)
+        with timed(metrics, 'condition'):
+            success = condition_func(summary_stats) * 1
+        sampling_metrics(metrics, monitor, trace, summary_stats)
+        results.append((success, summary_stats, out_df, metrics))
+    return results
+
+
+# State of a worker process in parallel mode. Filled once per process by _init_worker,
+# so that each worker builds (and compiles) its model only once.
+_worker_state = {}
+
+def _init_worker(model_func, layout_data, model_kwargs, fit_kwargs):
+    warnings.filterwarnings("ignore")
+    # With forked workers, the model compiled by the parent is found in the cache
+    _worker_state['model'] = get_model(model_func, layout_data, **model_kwargs)
+    _worker_state['fit_kwargs'] = fit_kwargs
+
+# A task is (key, seed sequence, setup); the key identifies the iteration to the parent
+def _worker_iteration(task):
+    key, seed_seq, setup = task
+    return (key, *_fit_iteration(_worker_state['model'], setup, seed_seq, progressbar=False,
+                                 **_worker_state['fit_kwargs']))
+
+# A batch task is (keys, seed sequences, setups), with one entry per dataset
+def _worker_batch(task):
+    keys, seed_seqs, setups = task
+    return [(key, *result) for key, result in 
+            zip(keys, _fit_batch(_worker_state['model'], setups, seed_seqs, progressbar=False,
+                                 **_worker_state['fit_kwargs']))]
+
+def _worker_pool(processes, model_func, layout_data, model_kwargs, fit_kwargs):
+    if fit_kwargs['cores'] != 1:
+        logger.info('[PARALLEL] Worker processes sample their chains sequentially (cores=1).')
+        fit_kwargs = dict(fit_kwargs, cores=1) # Pool workers are daemonic and cannot start chain processes
+    logger.info('[PARALLEL] Distributing iterations across %d worker processes.' % processes)
+    return multiprocessing.get_context(_mp_start_method()).Pool(
+        processes, initializer=_init_worker,
+        initargs=(model_func, layout_data, model_kwargs, fit_kwargs))
+
+
+# Writes (and passes on) the metrics record of an iteration. The columns of the metrics file 
+# are fixed by its first record; approximate backends leave the NUTS counters empty.
+def _report_metrics(metrics, metrics_outfile, outfile, metrics_callback, header):
+    if metrics_outfile == 'auto':
+        metrics_outfile = outfile + '.metrics.csv'
+    if metrics_outfile is not None:
+        record = pd.DataFrame([metrics]).set_index('iteration')
+        if header or not os.path.exists(metrics_outfile):
+            record.reindex(columns=METRICS_COLUMNS).to_csv(metrics_outfile)
+        else:
+            record.reindex(columns=METRICS_COLUMNS).to_csv(metrics_outfile, mode='a', header=False)
+    if metrics_callback is not None:
+        metrics_callback(metrics)
+
+
+# The warm start of a run (or None), see _warm_start
+def _warm_start_if(warm_start, backend, needed, model, setup, entropy, tune, chains, cores, target_accept):
+    if not warm_start or not needed:
+        return None
+    if backend != 'nuts':
+        logger.warning('[WARM START] Only the nuts backend can be warm-started, the %s backend starts from scratch.' % backend)
+        return None
+    return _warm_start(model, setup, _iteration_seed_sequence(entropy, WARM_START_KEY),
+                       tune, chains, cores, target_accept)
+
+
+# The task of the batch of iterations start, start + 1, ..., start + batch_size - 1. Slots beyond the
+# last iteration are filled with the first iteration of the batch (and dropped from the results).
+def _batch_task(entropy, setups, start, batch_size):
+    keys = [i if i < len(setups) else len(setups) for i in range(start, start + batch_size)]
+    indices = [i if i < len(setups) else start for i in range(start, start + batch_size)]
+    return (keys, [_iteration_seed_sequence(entropy, i) for i in indices], [setups[i] for i in indices])
+
+
+# Sequential stopping rules based on the beta posterior of the power estimate
+def _stopping_reason(hdi, attempts, min_iterations, stop_hdi_width, target_power):
+    if attempts < min_iterations:
+        return None
+    if stop_hdi_width is not None and hdi[1] - hdi[0] < stop_hdi_width:
+        return 'the HDI of the power estimate is narrower than %.2f' % stop_hdi_width
+    if target_power is not None and hdi[0] > target_power:
+        return 'the HDI of the power estimate lies above the target power %.2f' % target_power
+    if target_power is not None and hdi[1] < target_power:
+        return 'the HDI of the power estimate lies below the target power %.2f' % target_power
+    return None
+
+
+# Forking lets the workers inherit the imported modules (and Theano's state) cheaply.
+# It is not available on Windows, where the default start method is used instead.
+def _mp_start_method():
+    return 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+
 
 def sim_and_fit(setup, model_func, iterations, condition_func, 
                 goal_var_names=None, log_var_names=['C_mu', 'wp_mu'],
@@ -235,52 +691,265 @@ def sim_and_fit(setup, model_func, iterations, condition_func,
                 turn_off_warnings=True,
                 tune=1000,
                 target_accept=0.85,
-                init='adapt_diag'):
+                init='adapt_diag',
+                chains=4,
+                cores=4,
+                processes=None,
+                seed=None,
+                stop_hdi_width=None,
+                target_power=None,
+                min_iterations=10,
+                backend='nuts',
+                backend_kwargs=None,
+                checkpoint='auto',
+                resume=False,
+                metrics_outfile='auto',
+                metrics_callback=None,
+                pilot_trace=None,
+                warm_start=False,
+                warm_start_tune=1000,
+                batch_size=1,
+                shard=None,
+                output_kwargs=None):
+    '''Repeatedly simulates and fits experiments and estimates the power (rate of successes).
+
+    :param iterations: Number of simulated experiments (the maximum number if a stopping rule is given)
+
+    :param processes: If given, the iterations are distributed across this many worker processes.
+                      Each worker samples its chains sequentially (cores=1), so a good choice
+                      is the number of available CPU cores divided by the number of chains.
+    :param seed: Master seed from which the random streams of all iterations are derived. 
+                 Runs with the same seed give the same results, regardless of the number of processes.
+    :param stop_hdi_width: Stop early once the 95 % HDI of the power estimate is narrower than this
+    :param target_power: Stop early once the 95 % HDI of the power estimate lies entirely above
+                         or below this value (e.g., 0.8)
+    :param min_iterations: Number of iterations to run before any stopping rule is applied
+    :param backend: The inference method: 'nuts' (full MCMC), 'numba' (full MCMC with NUTS compiled for 
+                    hierarchical_model_noncentered, see compiled.py), or the much faster approximations
+                    'advi' (mean-field ADVI), 'laplace' (normal approximation around the MAP), 
+                    and 'mle' (per-participant maximum likelihood fits, see mle.py) for screening designs. The summary frames passed to condition_func have the
+                    same index and columns for all backends.
+    :param backend_kwargs: Additional keyword arguments for the backend, e.g., {'n': 50000} (ADVI iterations)
+                           or {'max_treedepth': 12} (numba)
+    :param checkpoint: SQLite file in which every finished iteration is committed ('auto': outfile + '.checkpoint.sqlite',
+                       None: no checkpointing)
+    :param resume: Continue the run recorded in the checkpoint exactly where it stopped (with its master seed),
+                   instead of starting over
+    :param metrics_outfile: CSV file for the timing and sampler metrics of every iteration
+                            ('auto': outfile + '.metrics.csv', None: not written)
+    :param metrics_callback: A function that is called with the metrics record (a dict) of every iteration
+    :param pilot_trace: The trace of a pilot fit (e.g., returned by fit). If given, each iteration draws its 
+                        participants from one posterior draw of the pilot's hyperparameters (see 
+                        posterior_setups) instead of the hyperparameters in setup
+    :param warm_start: Adapt NUTS once, in a warm-up run with warm_start_tune tuning steps, and start the 
+                       adaptation of all iterations from its step size, mass matrix, and end points. Then, 
+                       a much smaller tune (e.g., 100) suffices for the iterations.
+    :param warm_start_tune: Number of tuning steps of the warm-up run
+    :param batch_size: Fit this many iterations (simulated experiments) jointly, in one batched model 
+                       (see hierarchical_model_noncentered) and one sampling run. For small designs, this
+                       spreads the overhead of sampling over the batch. The summaries of each iteration
+                       are the same as without batching. Results depend on the batch size (but not
+                       on the number of processes), and model_func has to support lists of datasets.
+    :param shard: (index, count): Only run the index-th of count equal parts of the iterations (index
+                  starting at 0), e.g., in one task of a batch-array job. With the same seed, the shards 
+                  together perform exactly the iterations of the whole run, which can be merged afterwards
+                  (see cli.py). The iterations keep their numbers in the output, but the power estimates 
+                  and stopping rules only refer to the shard's own iterations.
+    :param outfile: The output: a CSV file if the name ends in .csv, otherwise a directory with a typed,
+                    columnar results table written in chunks (Parquet with pyarrow, see results.py), 
+                    which read_results reads (with filters) and export_csv converts to CSV
+    :param output_kwargs: Options of the results directory, e.g., {'chunk_size': 500} (iterations per chunk)
+
+    :returns: The estimated power, its 95 % HDI, and the number of iterations performed
+    '''
 
+    _colored_logging()
     if (turn_off_warnings):
         warnings.filterwarnings("ignore")
         logging.warning('Attention: Warnings turned off. ') # There is so much from pymc3 and theano ..
 
     if log_var_names==None or len(log_var_names) < 1:
         sys.exit('log_var_names should not be empty or None! Log at least one variable!')
-    num_success=0
-    model = None
-    for i in tqdm(range(iterations), desc='Overall progress'):
-        data = simulate_tojs(setup)
-        if model is None:
-            model = model_func(data, single_C=single_C, single_wp=single_wp)
-        with model:
-            pymc3.set_data({'probe_first_count': data['probe_first_count']})
-            trace = pymc3.sample(2000, tune=tune, cores=4, init=init, target_accept=target_accept)
-            summary_stats = pymc3.summary(trace, var_names=goal_var_names, hdi_prob=0.95)
-            print(summary_stats)
-        success = condition_func(summary_stats) * 1 # Either 0 or 1, depending on reaching our goals.
-        num_success += success
-        attempts = (i+1)
+
+    store = None
+    completed = []
+    if checkpoint is not None:
+        store = Checkpoint(outfile + '.checkpoint.sqlite' if checkpoint == 'auto' else checkpoint, resume=resume)
+        completed = store.iterations()
+    elif resume:
+        sys.exit('Resuming requires a checkpoint!')
+
+    entropy = random.SeedSequence(seed).entropy
+    if store is not None:
+        entropy = store.entropy(entropy) # When resuming, the recorded master seed is used
+    logger.info('[SEED] Master seed of this run: %d' % entropy)
+
+    # The iterations of this run: all, or those of a shard
+    start, stop = 0, iterations
+    if shard is not None:
+        start, stop = shard[0] * iterations // shard[1], (shard[0] + 1) * iterations // shard[1]
+        logger.info('[SHARD] Shard %d of %d: iterations %d to %d.' % (shard[0] + 1, shard[1], start + 1, stop))
+
+    num_success = sum(success for _, success, _ in completed)
+    attempts = len(completed)
+    success_rate, hdi = None, None
+    first = start
+    output = open_results(outfile, 'run', **(output_kwargs or {}))
+    if completed:
         success_rate = num_success / attempts
-        hdi = HDIofICDF(beta,a=1+num_success, b=1+(attempts-num_success))
-        logging.info(('[ESTIMATE] Success rate: %.2f' % success_rate +
-                     ' [95 %% HDI: %.2f to %.2f]' % (hdi[0],hdi[1]) + 
-                     '\n' + '-'* 20))
-
-        out_df = pymc3.summary(trace, var_names=log_var_names, hdi_prob=0.95)
-        out_df.insert(0, 'iteration', attempts)
-        out_df.insert(1, 'success', success)
-        out_df.insert(2, 'power_est', success_rate)
-        out_df.insert(3, 'power_hdi_2.5%', hdi[0])
-        out_df.insert(4, 'power_hdi_97.5%', hdi[1])
-        if attempts == 1:
-            out_df.to_csv(outfile)
+        hdi = power_hdi(num_success, attempts)
+        logger.info('[RESUME] Resuming after iteration %d (success rate so far: %.2f).' % (start + attempts, success_rate))
+        output.append(pd.concat([out_df for _, _, out_df in completed])) # In sync with the checkpoint
+        first = start + attempts
+        reason = _stopping_reason(hdi, attempts, min_iterations, stop_hdi_width, target_power)
+        if reason is not None:
+            logger.info('[STOP] Nothing left to do after %d iterations: %s' % (attempts, reason))
+            first = stop
+    setups = [setup] * iterations
+    if pilot_trace is not None: # Drawn in one batch from the root stream (iterations use child streams)
+        setups = posterior_setups(pilot_trace, setup, iterations, rng=random.SeedSequence(entropy))
+    tasks = ((i, _iteration_seed_sequence(entropy, i), setups[i]) for i in range(first, stop))
+    if batch_size > 1: # Batches cover fixed ranges of iterations, so they are the same when resuming
+        tasks = (_batch_task(entropy, setups, b * batch_size, batch_size) 
+                 for b in range(first // batch_size, -(-stop // batch_size)))
+    fit_kwargs = dict(condition_func=condition_func, goal_var_names=goal_var_names,
+                      log_var_names=log_var_names, tune=tune, target_accept=target_accept,
+                      init=init, chains=chains, cores=cores,
+                      backend=backend, backend_kwargs=backend_kwargs)
+
+    pool = None
+    # Build (or fetch) the model and its step method once; forked workers inherit both
+    layout_data = simulate_tojs(setups[0], rng=0, as_counts=True) # Only used for the layout of the model
+    if batch_size > 1:
+        layout_data = [layout_data] * batch_size
+    model_kwargs = dict(single_C=single_C, single_wp=single_wp)
+    model = get_model(model_func, layout_data, **model_kwargs)
+    if backend == 'nuts':
+        _reusable_nuts(model, init, chains, target_accept)
+    fit_kwargs['warm_start'] = _warm_start_if(warm_start, backend, first < stop, model, setups[0], entropy,
+                                              warm_start_tune, chains, cores, target_accept)
+    if processes is None and batch_size == 1:
+        results = ((i, *_fit_iteration(model, task_setup, seed_seq, **fit_kwargs))
+                   for i, seed_seq, task_setup in tasks)
+    elif processes is None:
+        results = ((key, *result) for keys, seed_seqs, task_setups in tasks
+                   for key, result in zip(keys, _fit_batch(model, task_setups, seed_seqs, **fit_kwargs)))
+    else:
+        pool = _worker_pool(processes, model_func, layout_data, model_kwargs, fit_kwargs)
+        if batch_size == 1:
+            results = pool.imap(_worker_iteration, tasks) # Results arrive in iteration order
         else:
-            out_df.to_csv(outfile, mode='a', header=False)
+            results = (result for batch in pool.imap(_worker_batch, tasks) for result in batch)
+    if batch_size > 1: # Iterations done before resuming (or of other shards), and padding, are dropped
+        results = (result for result in results if first <= result[0] < stop)
+
+    try:
+        for i, success, summary_stats, out_df, metrics in tqdm(results, initial=first - start, total=max(first, stop) - start,
+                                                               desc='Overall progress'):
+            print(summary_stats)
+            num_success += success
+            attempts = (i+1) - start
+            success_rate = num_success / attempts
+            with timed(metrics, 'hdi'):
+                hdi = power_hdi(num_success, attempts)
+            logging.info(('[ESTIMATE] Success rate: %.2f' % success_rate +
+                         ' [95 %% HDI: %.2f to %.2f]' % (hdi[0],hdi[1]) + 
+                         '\n' + '-'* 20))
+
+            out_df.insert(0, 'iteration', i+1)
+            out_df.insert(1, 'success', success)
+            out_df.insert(2, 'power_est', success_rate)
+            out_df.insert(3, 'power_hdi_2.5%', hdi[0])
+            out_df.insert(4, 'power_hdi_97.5%', hdi[1])
+            with timed(metrics, 'write'):
+                if store is not None:
+                    store.record(i+1, success, out_df) # Committed before the output is written
+                output.append(out_df)
+            _report_metrics(dict(metrics, iteration=i+1), metrics_outfile, outfile, metrics_callback, 
+                            header=attempts == 1)
+
+            reason = _stopping_reason(hdi, attempts, min_iterations, stop_hdi_width, target_power)
+            if reason is not None:
+                logger.info('[STOP] Stopping after %d iterations: %s' % (attempts, reason))
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+        output.close()
+        if store is not None:
+            store.close()
+    return success_rate, hdi, attempts
+
+def reproduce_iteration(setup, model_func, iteration, seed, 
+                        single_C=False, single_wp=False,
+                        tune=1000,
+                        target_accept=0.85,
+                        init='adapt_diag',
+                        chains=4,
+                        cores=4,
+                        backend='nuts',
+                        backend_kwargs=None,
+                        pilot_trace=None,
+                        iterations=None,
+                        warm_start=False,
+                        warm_start_tune=1000,
+                        batch_size=1):
+    '''Repeats a single iteration of a sim_and_fit run in isolation (e.g., a slow or divergent one), 
+    with the same simulated data and the same sampler seeds. All arguments are as in the run.
+
+    :param iteration: The iteration to repeat, as numbered in the output file (starting at 1)
+    :param seed: The master seed of the run (see the [SEED] line of its log)
+    :param iterations: The number of iterations of the run (only needed with pilot_trace, or with
+                       batch_size if the iteration is in the last batch)
+
+    :returns: The simulated data (a TOJ dataframe) and the trace of the iteration, with all variables.
+              With a batch_size, the trace is that of the whole batch, in which the iteration is the
+              dataset (iteration - 1) % batch_size.
+    '''
+    entropy = random.SeedSequence(seed).entropy
+    setups = [setup] * max(iteration, iterations or 0)
+    if pilot_trace is not None:
+        if iterations is None:
+            logger.error('With a pilot_trace, the number of iterations of the run is needed.')
+            sys.exit('Aborting')
+        setups = posterior_setups(pilot_trace, setup, iterations, rng=random.SeedSequence(entropy))
+    layout_data = simulate_tojs(setups[0], rng=0, as_counts=True)
+    model = get_model(model_func, layout_data if batch_size == 1 else [layout_data] * batch_size, 
+                      single_C=single_C, single_wp=single_wp)
+    warm = _warm_start_if(warm_start, backend, True, model, setups[0], entropy, 
+                          warm_start_tune, chains, cores, target_accept)
+    if batch_size == 1:
+        seed_seqs, batch_setups = [_iteration_seed_sequence(entropy, iteration - 1)], [setups[iteration - 1]]
+    else: # As in _fit_batch
+        if iterations is None:
+            setups += [setup] * batch_size # Without the number of iterations, the batch is assumed to be full
+        _, seed_seqs, batch_setups = _batch_task(entropy, setups[:iterations], 
+                                                 (iteration - 1) // batch_size * batch_size, batch_size)
+    streams = [seed_seq.spawn(2) for seed_seq in seed_seqs] # As in _fit_iteration
+    datasets = [simulate_tojs(batch_setup, rng=random.default_rng(sim_seq)) 
+                for batch_setup, (sim_seq, _) in zip(batch_setups, streams)]
+    data = datasets[(iteration - 1) % batch_size]
+    set_model_data(model, data if batch_size == 1 else datasets)
+    sample_seq = streams[0][1]
+    trace = _sample_posterior(model, backend, tune=tune, chains=chains, cores=cores, init=init,
+                              target_accept=target_accept, random_seed=_chain_seeds(sample_seq, chains),
+                              backend_kwargs=backend_kwargs, warm_start=warm)
+    logger.info('[SEED] Repeated iteration %d of the run with master seed %d.' % (iteration, entropy))
+    return data, trace
 
 '''
-Convenience function to fit with logging.
+Convenience function to fit with logging. The summary written to outfile covers var_names 
+(default: all variables except for theta, which has one element per data row).
 '''            
-def fit(model, outfile='fit.csv'):
+def fit(model, outfile='fit.csv', backend='nuts', backend_kwargs=None, seed=None, var_names=None):
+    random_seed = None if seed is None else _chain_seeds(random.SeedSequence(seed), 4) # Reproducible if seeded
+    # The sampler settings fit has always used (pymc3's default target_accept of 0.8, unlike sim_and_fit)
+    trace = _sample_posterior(model, backend, draws=2000, tune=1000, chains=4, cores=4, init='adapt_diag',
+                              target_accept=0.8, random_seed=random_seed, backend_kwargs=backend_kwargs)
+    if var_names is None: # All variables except for theta (one per data row), as in sim_and_fit
+        var_names = _recorded_var_names(model, None, [])[0]
     with model:
-        trace = pymc3.sample(2000, tune=1000, cores=4, init='adapt_diag') #, target_accept=.85)
-        summary_stats = pymc3.summary(trace, hdi_prob=0.95)
+        summary_stats = pymc3.summary(trace, var_names=var_names, hdi_prob=0.95)
         summary_stats.to_csv(outfile)
     logger.info('The model was fitted and a summary was written to: ' + outfile)
     logger.info('You can analyze the returned trace with help of the Arviz library (https://arviz-devs.github.io/arviz/)')